@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+""" Headless batch solver over a corpus of game definitions
+
+Each input line is a JSON game definition:
+    {"id": "...", "verificators": [{"type": "Compare", "shape": "carre", "value": 4}, ...], "solution": [2, 4, 1]}
+with an optional "space": {"shapes": ["triangle", "carre", "rond", "etoile"], "max_value": 6}
+and each output line is the JSON result of the game, in input order.
+"""
+
+import argparse
+import json
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Iterable, Iterator, Optional, TextIO
+
+from game import Game
+from solver import Solver, MAX_ROUNDS
+from utils import Combi
+
+
+def combi_to_list(combi: Combi) -> list[int]:
+    """ Return the values of the combinaison """
+    return list(combi.values)
+
+
+def solve_game(spec: dict, engine: str = "python") -> dict:
+    """ Solve a game definition and return its result """
+    result: dict = {"id": spec.get("id")}
+    start = time.perf_counter()
+    try:
+        game = Game.from_spec(spec)
+        solver = Solver(game, engine=engine)
+        solver.cleanup_combinaisons()
+        result["candidates"] = len(solver.possibles)
+
+        if spec.get("solution") is None:
+            # nothing to play against, only give the opening move
+            combi, verifs = solver.min_max_solve()
+            result["opening"] = {"combi": combi_to_list(combi), "verifs": [verif.get_slot() for verif in verifs]}
+        else:
+            if game.solution not in solver.possibles:
+                raise ValueError(f"Solution {game.solution} can't be the solution of this game")
+            moves = []
+            while not solver.is_finished() and len(moves) < MAX_ROUNDS:
+                combi, tries = solver.solve()
+                moves.append({
+                    "combi": combi_to_list(combi),
+                    "verifs": [{"slot": verif.get_slot(), "result": res} for verif, res in tries],
+                })
+            result["solved"] = solver.is_finished()
+            result["found"] = [combi_to_list(combi) for combi in solver.possibles] if solver.is_finished() else None
+            result["moves"] = moves
+            result["rounds"] = len(moves)
+            result["queries"] = sum(len(move["verifs"]) for move in moves)
+        solver.close()
+    except (AssertionError, KeyError, TypeError, ValueError) as error:
+        result["error"] = f"{type(error).__name__}: {error}"
+    result["time"] = time.perf_counter() - start
+    return result
+
+
+def solve_line(line: str, engine: str = "python") -> dict:
+    """ Solve a JSON line game definition """
+    try:
+        spec = json.loads(line)
+    except json.JSONDecodeError as error:
+        return {"id": None, "error": f"JSONDecodeError: {error}"}
+    return solve_game(spec, engine)
+
+
+def iter_results(lines: Iterable[str], workers: int = 1, engine: str = "python", window: Optional[int] = None) -> Iterator[dict]:
+    """ Solve every game line, yielding results in input order
+
+    At most window games are in flight at once, so memory stays bounded
+    whatever the size of the corpus.
+    """
+    lines = (line for line in lines if line.strip())
+    if workers <= 1:
+        for line in lines:
+            yield solve_line(line, engine)
+        return
+
+    window = window or 4 * workers
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending: deque[Future] = deque()
+        for line in lines:
+            pending.append(executor.submit(solve_line, line, engine))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def run(input_file: TextIO, output_file: TextIO, workers: int = 1, engine: str = "python") -> None:
+    """ Stream the results of the games of input_file to output_file, as JSON lines """
+    for result in iter_results(input_file, workers, engine):
+        output_file.write(json.dumps(result) + "\n")
+        output_file.flush()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Solve a corpus of games without GUI")
+    parser.add_argument("input", nargs="?", default="-", help="JSON lines game definitions (default: stdin)")
+    parser.add_argument("-o", "--output", default="-", help="JSON lines results (default: stdout)")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="number of worker processes")
+    parser.add_argument("-e", "--engine", choices=["python", "numpy"], default="python", help="solver engine")
+    args = parser.parse_args()
+
+    input_stream = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    output_stream = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        run(input_stream, output_stream, args.workers, args.engine)
+    finally:
+        if input_stream is not sys.stdin:
+            input_stream.close()
+        if output_stream is not sys.stdout:
+            output_stream.close()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+""" Micro and macro benchmarks of the solver hot paths
+
+Results are written as JSON (seconds per call for every benchmark) and can be
+compared to a baseline file: the run fails when a benchmark is slower than
+its baseline by more than the threshold ratio.
+"""
+
+import argparse
+import json
+import random
+import sys
+import timeit
+from typing import Callable, Optional
+
+from verificators import Verificator, Compare, OccurenceVal, OccurenceAll, Smallest, Compare2
+from candidates import CandidateSet
+from game import Game, main_game
+from solver import Solver
+from utils import Combi, Shape, DEFAULT_SPACE
+
+SEEDS = [0, 1, 2, 3]
+
+
+def random_verificator(rng: random.Random) -> Verificator:
+    """ Return a random verificator """
+    shapes = list(DEFAULT_SPACE.shapes)
+    choice = rng.randrange(5)
+    if choice == 0:
+        return Compare(rng.choice(shapes), rng.randint(1, 5))
+    if choice == 1:
+        return OccurenceVal(rng.randint(1, 5))
+    if choice == 2:
+        return OccurenceAll()
+    if choice == 3:
+        return Smallest()
+    shape1, shape2 = rng.sample(shapes, 2)
+    return Compare2(shape1, shape2)
+
+
+def seeded_game(seed: int) -> Game:
+    """ Return a reproducible game of 6 verificators, with a valid solution """
+    rng = random.Random(seed)
+    while True:
+        game = Game(*[random_verificator(rng) for _ in range(6)])
+        solver = Solver(game)
+        solver.cleanup_combinaisons()
+        if solver.possibles:
+            game.set_solution(rng.choice(list(solver.possibles)))
+            return game
+
+
+def play(game: Game) -> None:
+    """ Play a full game """
+    solver = Solver(game)
+    solver.cleanup_combinaisons()
+    while not solver.is_finished():
+        solver.solve()
+
+
+def measure(function: Callable[[], object], repeat: int = 5) -> float:
+    """ Return the best time of a call to function, in seconds """
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def micro_benchmarks() -> dict[str, Callable[[], object]]:
+    """ Return the micro benchmarks """
+    benchmarks: dict[str, Callable[[], object]] = {}
+    combi = Combi(2, 4, 1)
+    all_combis = Combi.list_all()
+    possibles = CandidateSet.full()
+    verificators = [Compare(Shape.CARRE, 4), OccurenceVal(3), OccurenceAll(), Smallest(), Compare2(Shape.TRIANGLE, Shape.CARRE)]
+    for verif in verificators:
+        name = type(verif).__name__
+        result = verif.get_res(combi)
+        benchmarks[f"{name}.get_res"] = lambda verif=verif: [verif.get_res(possible) for possible in all_combis]
+        benchmarks[f"{name}.make_try"] = lambda verif=verif, result=result: verif.make_try(possibles.copy(), result, True)
+        benchmarks[f"{name}.discard"] = lambda verif=verif: verif.discard(possibles.copy(), combi, False)
+
+    benchmarks["Combi.__init__"] = lambda: Combi(2, 4, 1)
+    benchmarks["Combi.__hash__"] = lambda: [hash(possible) for possible in all_combis]
+
+    def cleanup():
+        solver = Solver(main_game())
+        solver.cleanup_combinaisons()
+    benchmarks["Solver.cleanup_combinaisons"] = cleanup
+    return benchmarks
+
+
+def macro_benchmarks() -> dict[str, Callable[[], object]]:
+    """ Return the macro benchmarks """
+    benchmarks: dict[str, Callable[[], object]] = {}
+    games = {"main": main_game()}
+    games.update({f"seed{seed}": seeded_game(seed) for seed in SEEDS})
+    for name, game in games.items():
+        # the search from the first state of the game, the solver being built and cleaned up once
+        solver = Solver(game)
+        solver.cleanup_combinaisons()
+
+        def min_max_solve(solver=solver):
+            # partitions are cached by the solver between searches of the same state
+            solver.partition_cache = None
+            solver.min_max_solve()
+        benchmarks[f"min_max_solve.{name}"] = min_max_solve
+        benchmarks[f"solve.{name}"] = lambda game=game: play(game)
+    return benchmarks
+
+
+def run(selected: Optional[str] = None) -> dict[str, float]:
+    """ Run the benchmarks whose name contains selected """
+    results = {}
+    for name, function in {**micro_benchmarks(), **macro_benchmarks()}.items():
+        if selected is None or selected in name:
+            results[name] = measure(function)
+            print(f"{name:<40} {results[name] * 1e6:>12.1f} us", file=sys.stderr)
+    return results
+
+
+def compare(results: dict[str, float], baseline: dict[str, float], threshold: float) -> list[str]:
+    """ Return the benchmarks slower than baseline by more than threshold """
+    regressions = []
+    for name, duration in results.items():
+        if name in baseline and duration > baseline[name] * threshold:
+            regressions.append(f"{name}: {duration * 1e6:.1f} us vs {baseline[name] * 1e6:.1f} us in baseline")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the solver")
+    parser.add_argument("-o", "--output", default="bench_results.json", help="file to write the results to")
+    parser.add_argument("-b", "--baseline", help="baseline results to compare to")
+    parser.add_argument("-t", "--threshold", type=float, default=1.5, help="maximum slowdown ratio allowed")
+    parser.add_argument("-k", "--select", help="only run benchmarks containing this name")
+    args = parser.parse_args()
+
+    bench_results = run(args.select)
+    with open(args.output, "w", encoding="utf-8") as output:
+        json.dump(bench_results, output, indent=2, sort_keys=True)
+
+    if args.baseline is not None:
+        with open(args.baseline, encoding="utf-8") as baseline_file:
+            failures = compare(bench_results, json.load(baseline_file), args.threshold)
+        for failure in failures:
+            print(f"Regression: {failure}", file=sys.stderr)
+        if failures:
+            sys.exit(1)
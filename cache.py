@@ -0,0 +1,84 @@
+""" Cache of the best moves, shared between solvers and sessions """
+
+import sqlite3
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+from game import Game
+
+Move = tuple[int, tuple[str, ...]]
+
+
+class MoveCache:
+    """ Best moves keyed by game signature and candidates bitset
+
+    A move is stored as the combinaison index and the slots of the chosen
+    verificators. Moves are kept in memory in a LRU of max_size entries,
+    and in a sqlite file at path if given, so they survive restarts.
+    """
+    def __init__(self, max_size: int = 1024, path: Optional[str] = None) -> None:
+        assert max_size > 0
+        self.max_size = max_size
+        self.moves: OrderedDict[tuple[str, int], Move] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.connection: Optional[sqlite3.Connection] = None
+        if path is not None:
+            self.connection = sqlite3.connect(path, check_same_thread=False)
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS moves (signature TEXT, candidates TEXT, combi INTEGER, verifs TEXT, "
+                "PRIMARY KEY (signature, candidates))"
+            )
+            self.connection.commit()
+
+    def get(self, signature: str, candidates: int) -> Optional[Move]:
+        """ Return the cached move, or None """
+        key = (signature, candidates)
+        move = self.moves.get(key)
+        if move is None and self.connection is not None:
+            row = self.connection.execute(
+                "SELECT combi, verifs FROM moves WHERE signature = ? AND candidates = ?", (signature, f"{candidates:x}")
+            ).fetchone()
+            if row is not None:
+                move = (row[0], tuple(row[1].split(",")))
+                self.__remember(key, move)
+        if move is None:
+            self.misses += 1
+            return None
+        self.moves.move_to_end(key)
+        self.hits += 1
+        return move
+
+    def put(self, signature: str, candidates: int, move: Move) -> None:
+        """ Store a move """
+        self.__remember((signature, candidates), move)
+        if self.connection is not None:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO moves VALUES (?, ?, ?, ?)", (signature, f"{candidates:x}", move[0], ",".join(move[1]))
+            )
+            self.connection.commit()
+
+    def warm(self, games: Iterable[Game]) -> None:
+        """ Compute and store the opening move of each game """
+        # imported here as the solver itself uses the cache
+        from solver import Solver
+
+        for game in games:
+            solver = Solver(game, cache=self)
+            solver.cleanup_combinaisons()
+            solver.min_max_solve()
+
+    def close(self) -> None:
+        """ Close the on-disk store """
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def __remember(self, key: tuple[str, int], move: Move) -> None:
+        self.moves[key] = move
+        self.moves.move_to_end(key)
+        if len(self.moves) > self.max_size:
+            self.moves.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self.moves)
@@ -0,0 +1,93 @@
+from typing import Iterable, Iterator, Union
+from utils import Combi, CodeSpace, DEFAULT_SPACE
+
+def popcount(bits: int) -> int:
+    """ Return the number of bits set """
+    return bin(bits).count("1")
+
+if hasattr(int, "bit_count"):  # python >= 3.10
+    popcount = int.bit_count
+
+def bit_indexes(bits: int) -> Iterator[int]:
+    """ Iterate over the indexes of the bits set, in increasing order """
+    reversed_bits = bin(bits)[:1:-1]
+    index = reversed_bits.find("1")
+    while index != -1:
+        yield index
+        index = reversed_bits.find("1", index + 1)
+
+class CandidateSet:
+    """ Define a set of combinaisons, stored as a bitset over the combinaison indexes
+
+    Combinaisons are only built when iterating, so large code spaces never
+    hold a Combi per candidate.
+    """
+    __slots__ = ("bits", "space")
+    bits: int
+    space: CodeSpace
+
+    def __init__(self, bits: int = 0, space: CodeSpace = DEFAULT_SPACE) -> None:
+        assert 0 <= bits <= space.get_full_mask()
+        self.bits = bits
+        self.space = space
+
+    @classmethod
+    def full(cls, space: CodeSpace = DEFAULT_SPACE) -> "CandidateSet":
+        """ Return the set of all combinaisons """
+        return cls(space.get_full_mask(), space)
+
+    @classmethod
+    def from_combis(cls, combis: Iterable[Combi], space: CodeSpace = DEFAULT_SPACE) -> "CandidateSet":
+        """ Return the set containing the given combinaisons """
+        bits = 0
+        for combi in combis:
+            bits |= 1 << combi.index
+        return cls(bits, space)
+
+    def get_bits(self) -> int:
+        """ Return the underlying bitset """
+        return self.bits
+
+    def indexes(self) -> Iterator[int]:
+        """ Iterate over the indexes of the combinaisons, in increasing order """
+        return bit_indexes(self.bits)
+
+    def intersect(self, mask: Union[int, "CandidateSet"]) -> None:
+        """ Only keep the combinaisons that are in mask """
+        self.bits &= mask.bits if isinstance(mask, CandidateSet) else mask
+
+    def add(self, combi: Combi) -> None:
+        self.bits |= 1 << combi.index
+
+    def remove(self, combi: Combi) -> None:
+        if combi not in self:
+            raise KeyError(combi)
+        self.discard(combi)
+
+    def discard(self, combi: Combi) -> None:
+        self.bits &= ~(1 << combi.index)
+
+    def copy(self) -> "CandidateSet":
+        return CandidateSet(self.bits, self.space)
+
+    def __and__(self, other: Union[int, "CandidateSet"]) -> "CandidateSet":
+        return CandidateSet(self.bits & (other.bits if isinstance(other, CandidateSet) else other), self.space)
+
+    def __contains__(self, combi: Combi) -> bool:
+        return bool(self.bits >> combi.index & 1)
+
+    def __iter__(self) -> Iterator[Combi]:
+        for index in self.indexes():
+            yield Combi.from_index(index, self.space)
+
+    def __len__(self) -> int:
+        return popcount(self.bits)
+
+    def __bool__(self) -> bool:
+        return self.bits != 0
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, CandidateSet) and self.bits == other.bits and self.space == other.space
+
+    def __repr__(self) -> str:
+        return f"CandidateSet({', '.join(str(combi) for combi in self)})"
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+""" Compiled game files: verificator tables and cleaned up candidates, loaded without recomputation
+
+Layout, little endian:
+    header      magic, format version, number of verificators, sha256 of the game signature,
+                code space size, length of the description
+    description JSON game definition and result codes kept by the cleanup
+    tables      per verificator, a signed byte result code per combinaison
+    masks       per verificator and result code (NO_RESULT last), the bitset of the combinaisons having it
+    candidates  bitset of the combinaisons left by the cleanup
+"""
+
+import argparse
+import hashlib
+import json
+import mmap
+import struct
+from typing import Optional
+
+from verificators import MultiCriterion
+from candidates import CandidateSet
+from game import Game
+from solver import Solver
+
+MAGIC = b"TMCG"
+# to increase when the layout or the verificators results change
+VERSION = 1
+HEADER = struct.Struct("<4sHH32sII")
+
+
+def get_hash(game: Game) -> bytes:
+    """ Return the hash identifying the game setup """
+    return hashlib.sha256(game.get_signature().encode()).digest()
+
+
+def compile_game(game: Game, path: str) -> None:
+    """ Write the compiled game to path """
+    if any(isinstance(verif, MultiCriterion) for verif in game.get_verificators()):
+        raise ValueError("Games with unknown criteria can't be compiled")
+    solver = Solver(game)
+    solver.cleanup_combinaisons()
+    size = game.space.get_size()
+    mask_size = (size + 7) // 8
+    verifs = solver.get_verifs()
+
+    codes = [[verif.get_results().index(res) for verif, res in zip(verifs, results)] for results in solver.results]
+    description = json.dumps({"game": game.get_spec(), "results": codes}).encode()
+    with open(path, "wb") as output:
+        output.write(HEADER.pack(MAGIC, VERSION, len(verifs), get_hash(game), size, len(description)))
+        output.write(description)
+        for verif in verifs:
+            output.write(struct.pack(f"<{size}b", *verif.get_table()))
+        for verif in verifs:
+            for _, true_mask in verif.get_masks():
+                output.write(true_mask.to_bytes(mask_size, "little"))
+        output.write(solver.possibles.get_bits().to_bytes(mask_size, "little"))
+
+
+class CompiledGame:
+    """ A compiled game file, memory-mapped
+
+    The verificator tables are views on the file, and masks and candidates
+    are read from their bytes. The file stays mapped as long as its tables
+    are used.
+    """
+    def __init__(self, path: str, game: Optional[Game] = None) -> None:
+        """ Load the compiled game of path, checking it was compiled for game if given """
+        with open(path, "rb") as input_file:
+            self.buffer = mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self.buffer)
+        if len(view) < HEADER.size:
+            raise ValueError(f"{path} is not a compiled game")
+        magic, version, nb_verifs, game_hash, size, description_size = HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a compiled game")
+        if version != VERSION:
+            raise ValueError(f"{path} was compiled with version {version} instead of {VERSION}")
+        if game is not None and get_hash(game) != game_hash:
+            raise ValueError(f"{path} was compiled for another game")
+
+        offset = HEADER.size
+        description = json.loads(bytes(view[offset:offset + description_size]))
+        offset += description_size
+        self.game = Game.from_spec(description["game"])
+        if get_hash(self.game) != game_hash or self.game.space.get_size() != size or len(self.game.get_verificators()) != nb_verifs:
+            raise ValueError(f"{path} doesn't match its game description")
+
+        verifs = self.game.get_verificators()
+        mask_size = (size + 7) // 8
+        expected_size = offset + nb_verifs * size + (sum(len(verif.get_results()) + 1 for verif in verifs) + 1) * mask_size
+        if len(view) != expected_size:
+            raise ValueError(f"{path} has an unexpected size")
+
+        tables = []
+        for _ in verifs:
+            tables.append(view[offset:offset + size].cast("b"))
+            offset += size
+        full_mask = self.game.space.get_full_mask()
+        for verif, table in zip(verifs, tables):
+            masks = []
+            for _ in range(len(verif.get_results()) + 1):
+                true_mask = int.from_bytes(view[offset:offset + mask_size], "little")
+                masks.append((full_mask & ~true_mask, true_mask))
+                offset += mask_size
+            verif.set_compiled(table, tuple(masks))
+        self.candidates = int.from_bytes(view[offset:offset + mask_size], "little")
+        self.results = [tuple(verif.get_results()[code] for verif, code in zip(verifs, codes)) for codes in description["results"]]
+
+    def get_solver(self, **kwargs) -> Solver:
+        """ Return a solver of the game, in the state left by cleanup_combinaisons """
+        solver = Solver(self.game, **kwargs)
+        solver.possibles = CandidateSet(self.candidates, self.game.space)
+        solver.results = list(self.results)
+        return solver
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile a game definition")
+    parser.add_argument("input", help="JSON game definition, as read by batch.py")
+    parser.add_argument("output", help="compiled game file")
+    args = parser.parse_args()
+
+    with open(args.input, encoding="utf-8") as game_file:
+        compile_game(Game.from_spec(json.load(game_file)), args.output)
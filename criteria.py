@@ -0,0 +1,148 @@
+""" Expressions over the shapes of a combinaison, defining verificator criteria
+
+An expression is a python-like formula, e.g. "compare(triangle + carre, 6)",
+made of:
+    - shape names (triangle, carre, rond...), the value of the shape
+    - integers, and + - * // % between values
+    - comparisons (< <= == != > >=), whose results are False and True
+    - compare(a, b): "<", "=" or ">"
+    - parity(a): "even" or "odd"
+    - count(value): the number of shapes with value
+    - even(), odd(): the number of shapes with an even / odd value
+    - total(): the sum of the values
+    - max_count(): the largest number of shapes sharing a value
+    - distinct(): the number of different values
+    - smallest(), largest(): the shape with the lowest / highest value, no result on a tie
+    - order(): "ascending", "descending" or "neither", over the shapes in order
+It is compiled for a code space into a function of the combinaison values
+and the list of its possible results.
+"""
+
+import ast
+import operator
+from typing import Any, Callable, Optional
+
+from utils import Shape, CodeSpace
+
+Values = tuple[int, ...]
+Function = Callable[[Values], Any]
+
+OPERATORS: dict[type, Callable[[Any, Any], Any]] = {
+    ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.FloorDiv: operator.floordiv, ast.Mod: operator.mod,
+}
+COMPARISONS: dict[type, Callable[[Any, Any], bool]] = {
+    ast.Lt: operator.lt, ast.LtE: operator.le, ast.Eq: operator.eq, ast.NotEq: operator.ne, ast.Gt: operator.gt, ast.GtE: operator.ge,
+}
+COMPARE_RESULTS = ["<", "=", ">"]
+ORDER_RESULTS = ["ascending", "descending", "neither"]
+
+
+def compare(first: int, second: int) -> str:
+    """ Return how first compares to second """
+    if first < second:
+        return "<"
+    if first > second:
+        return ">"
+    return "="
+
+
+def order(values: Values) -> str:
+    """ Return if values are strictly ascending, strictly descending or neither """
+    if all(first < second for first, second in zip(values, values[1:])):
+        return "ascending"
+    if all(first > second for first, second in zip(values, values[1:])):
+        return "descending"
+    return "neither"
+
+
+def extreme(space: CodeSpace, values: Values, value: int) -> Optional[Shape]:
+    """ Return the only shape with value, None if there are several """
+    if values.count(value) > 1:
+        return None
+    return space.shapes[values.index(value)]
+
+
+class Expression:
+    """ Define a criterion expression, compiled once per code space """
+    def __init__(self, source: str) -> None:
+        self.source = source
+        try:
+            self.tree = ast.parse(source, mode="eval").body
+        except SyntaxError as error:
+            raise ValueError(f"Expression {source} is not valid: {error.msg}") from error
+        self.compiled: dict[CodeSpace, tuple[Function, list]] = {}
+
+    def compile(self, space: CodeSpace) -> tuple[Function, list]:
+        """ Return the function of the combinaison values and the results of the expression for space """
+        if space not in self.compiled:
+            function, results = self.__compile(self.tree, space)
+            if results is None:
+                # no fixed results: those taken over the code space, sorted
+                results = sorted({function(space.decode(index)) for index in range(space.get_size())} - {None})
+            self.compiled[space] = (function, results)
+        return self.compiled[space]
+
+    def __compile(self, node: ast.AST, space: CodeSpace) -> tuple[Function, Optional[list]]:
+        """ Return the function of node and its results, None if they depend on the values """
+        if isinstance(node, ast.Constant) and isinstance(node.value, int) and not isinstance(node.value, bool):
+            constant = node.value
+            return (lambda values: constant), None
+        if isinstance(node, ast.Name):
+            shape = Shape(node.id)
+            if shape not in space.positions:
+                raise ValueError(f"Shape {shape.value} is not in {space}")
+            position = space.positions[shape]
+            return (lambda values: values[position]), None
+        if isinstance(node, ast.BinOp) and type(node.op) in OPERATORS:
+            apply = OPERATORS[type(node.op)]
+            left, _ = self.__compile(node.left, space)
+            right, _ = self.__compile(node.right, space)
+            return (lambda values: apply(left(values), right(values))), None
+        if isinstance(node, ast.Compare) and len(node.ops) == 1 and type(node.ops[0]) in COMPARISONS:
+            test = COMPARISONS[type(node.ops[0])]
+            left, _ = self.__compile(node.left, space)
+            right, _ = self.__compile(node.comparators[0], space)
+            return (lambda values: test(left(values), right(values))), [False, True]
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and not node.keywords:
+            return self.__compile_call(node.func.id, [self.__compile(arg, space)[0] for arg in node.args], space)
+        raise ValueError(f"Expression {self.source} is not valid: {ast.dump(node)} is not supported")
+
+    def __compile_call(self, name: str, args: list[Function], space: CodeSpace) -> tuple[Function, Optional[list]]:
+        """ Return the function of a call and its results """
+        nb_shapes = len(space.shapes)
+        expected = {"compare": 2, "parity": 1, "count": 1}.get(name, 0)
+        if len(args) != expected:
+            raise ValueError(f"Expression {self.source} is not valid: {name} takes {expected} arguments")
+        if name == "compare":
+            first, second = args
+            return (lambda values: compare(first(values), second(values))), list(COMPARE_RESULTS)
+        if name == "parity":
+            argument = args[0]
+            return (lambda values: "odd" if argument(values) % 2 else "even"), ["even", "odd"]
+        if name == "count":
+            argument = args[0]
+            return (lambda values: values.count(argument(values))), list(range(nb_shapes + 1))
+        if name == "even":
+            return (lambda values: sum(1 for value in values if value % 2 == 0)), list(range(nb_shapes + 1))
+        if name == "odd":
+            return (lambda values: sum(1 for value in values if value % 2 == 1)), list(range(nb_shapes + 1))
+        if name == "total":
+            return sum, None
+        if name == "max_count":
+            return (lambda values: max(values.count(value) for value in values)), list(range(1, nb_shapes + 1))
+        if name == "distinct":
+            return (lambda values: len(set(values))), list(range(1, nb_shapes + 1))
+        if name == "smallest":
+            return (lambda values: extreme(space, values, min(values))), sorted(space.shapes, key=lambda shape: shape.value)
+        if name == "largest":
+            return (lambda values: extreme(space, values, max(values))), sorted(space.shapes, key=lambda shape: shape.value)
+        if name == "order":
+            return order, list(ORDER_RESULTS)
+        raise ValueError(f"Expression {self.source} is not valid: {name} is not a function")
+
+    def __reduce__(self):
+        # compiled functions can't be pickled, they are compiled again
+        return (Expression, (self.source,))
+
+    def __repr__(self) -> str:
+        return self.source
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+
+""" Exhaustive evaluation of the solver on a game, against every possible secret
+
+Every combinaison left by cleanup_combinaisons is set as the solution, and
+the solver plays until it finishes. The summary gives the distributions of
+rounds and verificator queries, the worst secrets and the percentiles of the
+time taken to find a move, as JSON; per secret results can be written as
+JSON lines.
+
+Secrets are sent to the workers by chunks. Each worker keeps one cleaned up
+solver per game, restored with pop after every secret, so that the tables
+are built once per process, or read from a compiled game file (compiled.py)
+shared by all the processes. With the parallel engine, secrets are played
+one after the other and the workers share each move search instead.
+"""
+
+import argparse
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Iterator, Optional, TextIO
+
+from verificators import MultiCriterion
+from cache import MoveCache
+from compiled import CompiledGame
+from game import Game, main_game
+from solver import Solver, get_shared_solver, MAX_ROUNDS
+from utils import Combi
+
+CHUNK_SIZE = 16
+WORST_CASES = 10
+PERCENTILES = (50, 90, 99)
+
+
+def get_solver(spec: dict, compiled: Optional[str] = None, engine: str = "python", strategy: str = "minmax", cache: bool = False,
+               workers: Optional[int] = None) -> Solver:
+    """ Return the cleaned up solver of the game, shared by the process, from the compiled game file if given """
+    def build() -> Solver:
+        move_cache = MoveCache() if cache else None
+        if compiled is not None:
+            return CompiledGame(compiled, Game.from_spec(spec)).get_solver(engine=engine, workers=workers, strategy=strategy, cache=move_cache)
+        solver = Solver(Game.from_spec(spec), engine=engine, workers=workers, strategy=strategy, cache=move_cache)
+        solver.cleanup_combinaisons()
+        return solver
+
+    key = ("evaluate", json.dumps(spec, sort_keys=True), compiled, engine, strategy, cache, workers)
+    return get_shared_solver(key, build)
+
+
+def evaluate_secret(solver: Solver, secret: Combi) -> dict[str, Any]:
+    """ Play the game against secret from the solver state, restored afterwards """
+    depth = solver.get_depth()
+    solver.push()
+    solver.game.set_solution(secret)
+    move_times = []
+    queries = 0
+    try:
+        while not solver.is_finished() and len(move_times) < MAX_ROUNDS:
+            start = time.perf_counter()
+            move = solver.find_move()
+            move_times.append(time.perf_counter() - start)
+            solver.play_move(*move)
+            queries += len(move[1])
+        found = solver.is_finished() and secret in solver.possibles
+    finally:
+        while solver.get_depth() > depth:
+            solver.pop()
+    return {"secret": list(secret.values), "rounds": len(move_times), "queries": queries, "solved": found, "move_times": move_times}
+
+
+def evaluate_secrets(spec: dict, indexes: list[int], compiled: Optional[str] = None, engine: str = "python",
+                     strategy: str = "minmax", cache: bool = False) -> list[dict[str, Any]]:
+    """ Evaluate the solver against the secrets of given indexes, run in a worker """
+    solver = get_solver(spec, compiled, engine, strategy, cache)
+    return [evaluate_secret(solver, Combi.from_index(index, solver.game.space)) for index in indexes]
+
+
+def iter_evaluations(game: Game, compiled: Optional[str] = None, workers: int = 1, engine: str = "python",
+                     strategy: str = "minmax", cache: bool = False) -> Iterator[dict[str, Any]]:
+    """ Evaluate the solver against every secret left by the cleanup, yielding results in secret order """
+    if any(isinstance(verif, MultiCriterion) for verif in game.get_verificators()):
+        # the active criteria are not part of the game definition sent to the workers
+        raise ValueError("Games with unknown criteria can't be evaluated")
+    spec = game.get_spec()
+    if engine == "parallel":
+        # the pool of the solver searches the moves, secrets are played here
+        solver = get_solver(spec, compiled, engine, strategy, cache, workers)
+        for index in solver.possibles.indexes():
+            yield evaluate_secret(solver, Combi.from_index(index, solver.game.space))
+        return
+
+    solver = get_solver(spec, compiled, engine, strategy, cache)
+    secrets = list(solver.possibles.indexes())
+    chunks = [secrets[index:index + CHUNK_SIZE] for index in range(0, len(secrets), CHUNK_SIZE)]
+    if workers <= 1:
+        for chunk in chunks:
+            yield from evaluate_secrets(spec, chunk, compiled, engine, strategy, cache)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(evaluate_secrets, spec, chunk, compiled, engine, strategy, cache) for chunk in chunks]
+        for future in futures:
+            yield from future.result()
+
+
+def percentile(values: list[float], rank: float) -> float:
+    """ Return the nearest rank percentile of sorted values """
+    if not values:
+        return 0.0
+    return values[min(max(int(rank / 100 * len(values) + 0.5) - 1, 0), len(values) - 1)]
+
+
+class EvaluationSummary:
+    """ Aggregated results of the secrets played """
+    def __init__(self) -> None:
+        self.secrets = 0
+        self.failures: list[list[int]] = []
+        # number of rounds / queries -> number of secrets
+        self.rounds: dict[int, int] = {}
+        self.queries: dict[int, int] = {}
+        # worst (rounds, queries) and their secrets
+        self.worst: dict[str, tuple[int, list[list[int]]]] = {"rounds": (0, []), "queries": (0, [])}
+        self.move_times: list[float] = []
+
+    def add(self, result: dict[str, Any]) -> None:
+        """ Add the result of a secret """
+        self.secrets += 1
+        if not result["solved"]:
+            self.failures.append(result["secret"])
+        for key, distribution in (("rounds", self.rounds), ("queries", self.queries)):
+            value = result[key]
+            distribution[value] = distribution.get(value, 0) + 1
+            worst, secrets = self.worst[key]
+            if value > worst:
+                self.worst[key] = (value, [result["secret"]])
+            elif value == worst and len(secrets) < WORST_CASES:
+                secrets.append(result["secret"])
+        self.move_times.extend(result["move_times"])
+
+    def to_dict(self) -> dict[str, Any]:
+        """ Return the summary, move times in milliseconds """
+        times = sorted(self.move_times)
+        summary: dict[str, Any] = {"secrets": self.secrets, "solved": self.secrets - len(self.failures), "failures": self.failures[:WORST_CASES]}
+        for key, distribution in (("rounds", self.rounds), ("queries", self.queries)):
+            worst, secrets = self.worst[key]
+            summary[f"average_{key}"] = sum(value * count for value, count in distribution.items()) / max(self.secrets, 1)
+            summary[f"max_{key}"] = worst
+            summary[f"{key}_distribution"] = {str(value): count for value, count in sorted(distribution.items())}
+            summary[f"worst_{key}_secrets"] = secrets
+        summary["moves"] = len(times)
+        summary["move_time_ms"] = {f"p{rank}": percentile(times, rank) * 1000 for rank in PERCENTILES}
+        summary["move_time_ms"]["max"] = times[-1] * 1000 if times else 0.0
+        return summary
+
+
+def run(game: Game, output_file: Optional[TextIO] = None, compiled: Optional[str] = None, workers: int = 1,
+        engine: str = "python", strategy: str = "minmax", cache: bool = False) -> dict[str, Any]:
+    """ Evaluate the solver on game, writing per secret results to output_file, and return the summary """
+    start = time.perf_counter()
+    summary = EvaluationSummary()
+    for result in iter_evaluations(game, compiled, workers, engine, strategy, cache):
+        summary.add(result)
+        if output_file is not None:
+            output_file.write(json.dumps(result) + "\n")
+    duration = time.perf_counter() - start
+    return {**summary.to_dict(), "time": duration, "secrets_per_second": summary.secrets / duration if duration else 0.0}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate the solver against every secret of a game")
+    parser.add_argument("input", nargs="?", help="JSON game definition, as read by batch.py (default: the game of main.py)")
+    parser.add_argument("-c", "--compiled", help="compiled game file of the game (see compiled.py), shared by the workers")
+    parser.add_argument("-o", "--output", help="JSON lines results of every secret")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="number of worker processes, searching each move with the parallel engine")
+    parser.add_argument("-e", "--engine", choices=Solver.engines, default="python", help="search engine of the solver")
+    parser.add_argument("-s", "--strategy", default="minmax", help="strategy of the solver")
+    parser.add_argument("--cache", action="store_true", help="share the moves found between the secrets of a worker")
+    args = parser.parse_args()
+
+    if args.input is not None:
+        with open(args.input, encoding="utf-8") as game_file:
+            eval_game = Game.from_spec(json.load(game_file))
+    elif args.compiled is not None:
+        eval_game = CompiledGame(args.compiled).game
+    else:
+        eval_game = main_game()
+    output_stream = open(args.output, "w", encoding="utf-8") if args.output is not None else None
+    try:
+        print(json.dumps(run(eval_game, output_stream, args.compiled, args.workers, args.engine, args.strategy, args.cache), indent=2))
+    finally:
+        if output_stream is not None:
+            output_stream.close()
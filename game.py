@@ -1,87 +1,111 @@
-from typing import Optional
-from verificators import Verificator
-from utils import Combi, Verifs
+import json
+from typing import Iterable, Optional, Sequence, Union
+from verificators import Verificator, Compare, OccurenceVal, Compare2, Smallest, verificator_from_spec, NO_RESULT
+from utils import Combi, Shape, Verifs, CodeSpace, DEFAULT_SPACE
+
+def slot_name(position: int) -> str:
+    """ Return the name of the slot at position: A to Z, then AA, AB... """
+    name = ""
+    position += 1
+    while position > 0:
+        position, letter = divmod(position - 1, 26)
+        name = chr(ord("A") + letter) + name
+    return name
 
 class Game:
-    """ Define a game setup """
+    """ Define a game setup
+
+    Verificators are registered by slot name, A, B, C... in the order given,
+    a None verificator leaving its slot empty. Extended variants can use any
+    number of slots, or name them with slots.
+    """
     solution: Combi
-    A: Verificator
-    B: Verificator
-    C: Verificator
-    D: Verificator
-    E: Optional[Verificator]
-    F: Optional[Verificator]
-
-    def __init__(self, A: Verificator, B: Verificator, C: Verificator, D: Verificator, E: Optional[Verificator] = None, F: Optional[Verificator] = None) -> None:
-        self.A = A
-        A.set_slot("A")
-        self.B = B
-        B.set_slot("B")
-        self.C = C
-        C.set_slot("C")
-        self.D = D
-        D.set_slot("D")
-        self.E = E
-        if E is not None:
-            E.set_slot("E")
-        self.F = F
-        if F is not None:
-            F.set_slot("F")
+    space: CodeSpace
+
+    def __init__(self, *verificators: Optional[Verificator], space: CodeSpace = DEFAULT_SPACE, slots: Optional[Sequence[str]] = None) -> None:
+        if slots is not None and len(slots) != len(verificators):
+            raise ValueError("There must be a slot name per verificator")
+        self.space = space
+        self.slots: dict[str, Verificator] = {}
+        for position, verif in enumerate(verificators):
+            if verif is None:
+                continue
+            name = slots[position] if slots is not None else slot_name(position)
+            if name in self.slots:
+                raise ValueError(f"Slot {name} is used twice")
+            verif.set_space(space)
+            verif.set_slot(name)
+            self.slots[name] = verif
+        if not self.slots:
+            raise ValueError("A game needs at least one verificator")
+        self.verificators = list(self.slots.values())
+
+    @classmethod
+    def from_spec(cls, spec: dict) -> "Game":
+        """ Build a game from its description: verificator specs, optional slot names and solution """
+        space = CodeSpace.from_spec(spec["space"]) if spec.get("space") is not None else DEFAULT_SPACE
+        game = cls(*[verificator_from_spec(verif_spec) for verif_spec in spec["verificators"]], space=space, slots=spec.get("slots"))
+        if spec.get("solution") is not None:
+            game.set_solution(Combi.from_values(spec["solution"], space))
+        return game
 
     def set_solution(self, solution: Combi) -> None:
         """ Set the solution """
         self.solution = solution
 
+    def get_slots(self) -> dict[str, Verificator]:
+        """ Return the verificators by slot name, in slot order (not to be modified) """
+        return self.slots
+
+    def get_verificators(self) -> list[Verificator]:
+        """ Return the verificators, in slot order (not to be modified) """
+        return self.verificators
+
     def list_verificators(self) -> list[dict[str, Verificator]]:
         """ Return the list of verificators """
-        result = [{"A": self.A}, {"B": self.B}, {"C": self.C}, {"D": self.D}]
-        result += [{"E": self.E}] if self.E is not None else []
-        result += [{"F": self.F}] if self.F is not None else []
-        return result
-
-    def get_verificator(self, choice: Verifs) -> Verificator:
-        """ Get the verificator for the choice """
-        if choice == Verifs.A:
-            return self.A
-        if choice == Verifs.B:
-            return self.B
-        if choice == Verifs.C:
-            return self.C
-        if choice == Verifs.D:
-            return self.D
-        if choice == Verifs.E:
-            if self.E is None:
-                raise ValueError("E is not defined")
-            return self.E
-        if choice == Verifs.F:
-            if self.F is None:
-                raise ValueError("F is not defined")
-            return self.F
-        raise ValueError(f"Choice {choice} is not valid")
-
-    def verify(self, choice: Verifs, test: Combi):
+        return [{slot: verif} for slot, verif in self.slots.items()]
+
+    def get_spec(self) -> dict:
+        """ Return the game definition read by from_spec, without the solution """
+        return {"verificators": [verif.get_spec() for verif in self.verificators], "slots": list(self.slots), "space": self.space.get_spec()}
+
+    def get_signature(self) -> str:
+        """ Return a canonical description of the verificators, identifying the game setup """
+        verifs = [[slot, verif.get_spec()] for slot, verif in self.slots.items()]
+        if self.space != DEFAULT_SPACE:
+            return json.dumps({"space": self.space.get_spec(), "verificators": verifs}, sort_keys=True)
+        return json.dumps(verifs, sort_keys=True)
+
+    def get_verificator(self, choice: Union[Verifs, str]) -> Verificator:
+        """ Get the verificator for the choice, a Verifs or a slot name """
+        slot = choice.value if isinstance(choice, Verifs) else choice
+        verif = self.slots.get(slot)
+        if verif is None:
+            raise ValueError(f"{slot} is not defined")
+        return verif
+
+    def verify(self, choice: Union[Verifs, str], test: Combi):
         """ Verify the test combinaison """
-        if choice == Verifs.A:
-            return self.A.verify(self.solution, test)
-        if choice == Verifs.B:
-            return self.B.verify(self.solution, test)
-        if choice == Verifs.C:
-            return self.C.verify(self.solution, test)
-        if choice == Verifs.D:
-            return self.D.verify(self.solution, test)
-        if choice == Verifs.E:
-            if self.E is None:
-                raise ValueError("E is not defined")
-            return self.E.verify(self.solution, test)
-        if choice == Verifs.F:
-            if self.F is None:
-                raise ValueError("F is not defined")
-            return self.F.verify(self.solution, test)
-        raise ValueError(f"Choice {choice} is not valid")
+        return self.get_verificator(choice).verify(self.solution, test)
+
+    def verify_many(self, choice: Union[Verifs, str], combis: Iterable[Combi]) -> list[bool]:
+        """ Verify every test combinaison, without marking the verificator solved """
+        verif = self.get_verificator(choice)
+        table = verif.get_table()
+        solution_code = table[self.solution.index]
+        assert solution_code != NO_RESULT
+        return [table[combi.index] == solution_code for combi in combis]
 
     def __str__(self) -> str:
         output = "\n" + "==="*21 + "\n"
         output += "Game configuration:"
-        output += ''.join(list(map(lambda verif: f'\n   - {list(verif.keys())[0]}: {str(list(verif.values())[0])}', self.list_verificators())))
+        output += ''.join(f'\n   - {slot}: {verif}' for slot, verif in self.slots.items())
         output += "\n" + "==="*21 + "\n"
         return output
+
+
+def main_game() -> Game:
+    """ Return the game played by main.py """
+    game = Game(Compare(Shape.CARRE, 4), OccurenceVal(3), Compare2(Shape.TRIANGLE, Shape.CARRE), Smallest())
+    game.set_solution(Combi(2, 4, 1))
+    return game
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+
+""" Puzzle generator: random verificator sets with a unique solution, rated by the solver
+
+Each output line is a JSON game definition, as read by batch.py and Game.from_spec:
+    {"id": 0, "verificators": [...], "solution": [2, 4, 1], "rounds": 3, "queries": 7, "difficulty": "medium"}
+"""
+
+import argparse
+import itertools
+import json
+import random
+import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, Optional, TextIO
+
+from verificators import Verificator, Compare, OccurenceVal, OccurenceAll, Smallest, Compare2, card_library, NO_RESULT
+from game import Game
+from solver import Solver, MAX_ROUNDS
+from utils import CodeSpace, DEFAULT_SPACE
+
+MAX_SAMPLES = 1000
+# (maximum rounds, maximum queries, name), the first one the puzzle fits in
+DIFFICULTIES = [(2, 3, "easy"), (2, 5, "medium"), (3, 7, "hard")]
+
+# compiled verificators of each code space (and library or not), built once per process
+_POOLS: dict[tuple[CodeSpace, bool], list[Verificator]] = {}
+
+
+def all_verificators(space: CodeSpace = DEFAULT_SPACE) -> list[Verificator]:
+    """ Return every verificator that can be used in a game of space """
+    verificators: list[Verificator] = [Compare(shape, value) for shape in space.shapes for value in range(1, space.max_value + 1)]
+    verificators += [OccurenceVal(value) for value in range(1, space.max_value + 1)]
+    verificators += [OccurenceAll(), Smallest()]
+    verificators += [Compare2(shape1, shape2) for shape1, shape2 in itertools.combinations(space.shapes, 2)]
+    for verif in verificators:
+        verif.set_space(space)
+    return verificators
+
+
+def get_pool(space: CodeSpace = DEFAULT_SPACE, library: bool = False) -> list[Verificator]:
+    """ Return the verificators of space, or the whole card library, with their tables compiled """
+    if (space, library) not in _POOLS:
+        _POOLS[(space, library)] = card_library(space) if library else all_verificators(space)
+        for verif in _POOLS[(space, library)]:
+            verif.get_masks()
+    return _POOLS[(space, library)]
+
+
+def get_difficulty(rounds: int, queries: int) -> str:
+    """ Return the difficulty name of a puzzle solved in rounds and queries """
+    for max_rounds, max_queries, name in DIFFICULTIES:
+        if rounds <= max_rounds and queries <= max_queries:
+            return name
+    return "expert"
+
+
+def find_solution(verifs: list[Verificator], rng: random.Random) -> Optional[int]:
+    """ Return a combinaison index identified by the results of verifs, none of them being redundant
+
+    A combinaison is identified when no other one has the same results. A
+    verificator is redundant when the others already identify the solution.
+    """
+    tables = [verif.get_table() for verif in verifs]
+    signatures = list(zip(*tables))
+    counts = Counter(signatures)
+    solutions = [index for index, signature in enumerate(signatures) if counts[signature] == 1 and NO_RESULT not in signature]
+    rng.shuffle(solutions)
+    for index in solutions:
+        # same[i] holds the combinaisons giving the same result as the solution on verifs[i]
+        same = [verif.get_masks()[table[index]][True] for verif, table in zip(verifs, tables)]
+        needed = True
+        for position in range(len(verifs)):
+            others = -1
+            for other_position, mask in enumerate(same):
+                if other_position != position:
+                    others &= mask
+            if others == 1 << index:
+                needed = False
+                break
+        if needed:
+            return index
+    return None
+
+
+def rate(spec: dict) -> tuple[int, int]:
+    """ Return the rounds and queries needed by the solver to find the solution of a game definition """
+    game = Game.from_spec(spec)
+    solver = Solver(game)
+    solver.cleanup_combinaisons()
+    rounds = queries = 0
+    while not solver.is_finished() and rounds < MAX_ROUNDS:
+        _, tries = solver.solve()
+        rounds += 1
+        queries += len(tries)
+    solver.close()
+    return rounds, queries
+
+
+def generate_puzzle(seed: int, nb_verifs: Optional[int] = None, space: CodeSpace = DEFAULT_SPACE, library: bool = False) -> dict:
+    """ Return the reproducible puzzle of seed, with 4 to 6 verificators unless nb_verifs is given """
+    rng = random.Random(seed)
+    pool = get_pool(space, library)
+    for _ in range(MAX_SAMPLES):
+        verifs = rng.sample(pool, nb_verifs or rng.randint(4, 6))
+        index = find_solution(verifs, rng)
+        if index is None:
+            continue
+        spec: dict = {"id": seed, "verificators": [verif.get_spec() for verif in verifs], "solution": list(space.decode(index))}
+        if space != DEFAULT_SPACE:
+            spec["space"] = space.get_spec()
+        spec["rounds"], spec["queries"] = rate(spec)
+        spec["difficulty"] = get_difficulty(spec["rounds"], spec["queries"])
+        return spec
+    raise ValueError(f"No puzzle found for seed {seed}")
+
+
+def iter_puzzles(count: int, seed: int = 0, workers: int = 1, nb_verifs: Optional[int] = None,
+                 space: CodeSpace = DEFAULT_SPACE, library: bool = False) -> Iterator[dict]:
+    """ Generate count puzzles, from seeds seed to seed + count - 1, in order """
+    seeds = range(seed, seed + count)
+    if workers <= 1:
+        for puzzle_seed in seeds:
+            yield generate_puzzle(puzzle_seed, nb_verifs, space, library)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(generate_puzzle, seeds, itertools.repeat(nb_verifs), itertools.repeat(space),
+                                 itertools.repeat(library), chunksize=16)
+
+
+def run(output_file: TextIO, count: int, seed: int = 0, workers: int = 1, nb_verifs: Optional[int] = None,
+        difficulty: Optional[str] = None, library: bool = False) -> None:
+    """ Write the generated puzzles to output_file, as JSON lines """
+    for puzzle in iter_puzzles(count, seed, workers, nb_verifs, library=library):
+        if difficulty is None or puzzle["difficulty"] == difficulty:
+            output_file.write(json.dumps(puzzle) + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate puzzles with a unique solution")
+    parser.add_argument("-n", "--count", type=int, default=100, help="number of puzzles to generate")
+    parser.add_argument("-s", "--seed", type=int, default=0, help="seed of the first puzzle")
+    parser.add_argument("-o", "--output", default="-", help="JSON lines puzzles (default: stdout)")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="number of worker processes")
+    parser.add_argument("-v", "--verificators", type=int, choices=[4, 5, 6], help="number of verificators (default: 4 to 6)")
+    parser.add_argument("-d", "--difficulty", choices=[name for _, _, name in DIFFICULTIES] + ["expert"], help="only keep puzzles of this difficulty")
+    parser.add_argument("-l", "--library", action="store_true", help="sample from the whole card library")
+    args = parser.parse_args()
+
+    output_stream = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        run(output_stream, args.count, args.seed, args.workers, args.verificators, args.difficulty, args.library)
+    finally:
+        if output_stream is not sys.stdout:
+            output_stream.close()
@@ -0,0 +1,50 @@
+""" Histories of played games, as structured events
+
+A history is written as a JSON line:
+    {"id": ..., "game": {"verificators": [...], "slots": [...], "space": {...}, "solution": [2, 4, 1]},
+     "rounds": [{"combi": [1, 2, 3], "verifs": [{"slot": "A", "result": true}, ...], "time": 0.5}, ...],
+     "solved": true}
+the solution being omitted when it is not known, and time counted from the start of the game.
+"""
+
+import json
+import time
+from typing import Any, Optional, Sequence, TextIO
+
+from verificators import Verificator
+from game import Game
+from utils import Combi
+
+
+class GameHistory:
+    """ Records the rounds played in a game """
+    def __init__(self, game: Game, game_id: Optional[Any] = None) -> None:
+        self.game = game
+        self.game_id = game_id
+        self.start = time.perf_counter()
+        self.rounds: list[dict[str, Any]] = []
+        self.solved = False
+
+    def record_round(self, combi: Combi, tries: Sequence[tuple[Verificator, bool]]) -> None:
+        """ Record a combinaison and the results of the verificators it was tested with """
+        self.rounds.append({
+            "combi": list(combi.values),
+            "verifs": [{"slot": verif.get_slot(), "result": res} for verif, res in tries],
+            "time": time.perf_counter() - self.start,
+        })
+
+    def truncate(self, nb_rounds: int) -> None:
+        """ Forget the rounds after the first nb_rounds, undone """
+        del self.rounds[nb_rounds:]
+
+    def to_dict(self) -> dict[str, Any]:
+        """ Return the history as a JSON compatible dict """
+        spec = self.game.get_spec()
+        if hasattr(self.game, "solution"):
+            spec["solution"] = list(self.game.solution.values)
+        return {"id": self.game_id, "game": spec, "rounds": self.rounds, "solved": self.solved}
+
+    def write(self, output: TextIO) -> None:
+        """ Write the history as a JSON line """
+        output.write(json.dumps(self.to_dict()) + "\n")
+        output.flush()
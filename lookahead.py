@@ -0,0 +1,140 @@
+""" Multi-round lookahead move search """
+
+import math
+from typing import Optional, Sequence
+
+from candidates import popcount, bit_indexes
+from search import Tables, Masks, PartitionCache, Progress, distinct_tries
+
+# a position is scored by its worst case number of rounds, then of verificator queries
+QUERY_WEIGHT = 1
+ROUND_WEIGHT = 1000
+UNBOUNDED = 2 ** 62
+
+
+def cost(rounds: int, queries: int) -> int:
+    """ Return the cost of a play, rounds first then queries """
+    return rounds * ROUND_WEIGHT + queries * QUERY_WEIGHT
+
+
+def estimate(nb_candidates: int, max_subset: int = 3) -> int:
+    """ Return a lower bound of the cost to solve nb_candidates
+
+    Each query splits the candidates in at most 2 and each round makes at
+    most max_subset queries.
+    """
+    if nb_candidates <= 1:
+        return 0
+    queries = math.ceil(math.log2(nb_candidates))
+    return cost(math.ceil(queries / max_subset), queries)
+
+
+class LookaheadSearch:
+    """ Plans several rounds ahead over (try, verificator subset, answers) trees
+
+    The tree is searched with branch and bound: a move is skipped when its
+    lower bound can't beat the best move found, and the answers of a move
+    stop being explored once it is worse than the best one. Only the width
+    best moves for the minmax strategy are expanded at each position, and
+    positions are stored in a transposition table keyed on the candidates
+    bitset, kept between moves. Past depth rounds, or once node_budget
+    positions were searched for a move, positions are scored with estimate.
+    """
+    def __init__(self, depth: int = 2, width: int = 8, node_budget: int = 20000) -> None:
+        assert depth > 0 and width > 0 and node_budget > 0
+        self.depth = depth
+        self.width = width
+        self.node_budget = node_budget
+        self.nodes = 0
+        self.tables: Tables = []
+        self.masks: Masks = []
+        self.subsets: Sequence[tuple[int, ...]] = []
+        # (candidates, depth) -> (cost, is exact)
+        self.transpositions: dict[tuple[int, int], tuple[int, bool]] = {}
+
+    def get_name(self) -> str:
+        """ Return a name identifying the search settings """
+        return f"lookahead-{self.depth}-{self.width}-{self.node_budget}"
+
+    def __bind(self, tables: Tables, masks: Masks, subsets: Sequence[tuple[int, ...]]) -> None:
+        """ Use the given game tables, dropping the transposition table if they changed """
+        if tables != self.tables or subsets != self.subsets:
+            self.tables, self.masks, self.subsets = tables, masks, subsets
+            self.transpositions = {}
+
+    def __moves(self, candidates: int) -> list[tuple[int, int, list[int]]]:
+        """ Return the width most promising (try, subset, blocks) moves that split candidates """
+        cache = PartitionCache(self.tables, self.masks, candidates)
+        tries = distinct_tries(self.tables, list(bit_indexes(candidates)))
+        moves = []
+        for subset_index, subset in enumerate(self.subsets):
+            for try_index in tries:
+                blocks = cache.get_partition(try_index, subset)
+                if len(blocks) > 1:
+                    moves.append((max(popcount(block) for block in blocks), len(subset), subset_index, try_index, blocks))
+        moves.sort(key=lambda move: move[:4])
+        return [(try_index, subset_index, blocks) for _, _, subset_index, try_index, blocks in moves[:self.width]]
+
+    def evaluate(self, candidates: int, depth: int, beta: int) -> int:
+        """ Return the worst case cost to solve candidates, or a lower bound >= beta """
+        nb_candidates = popcount(candidates)
+        if nb_candidates <= 1:
+            return 0
+        if depth == 0 or self.nodes >= self.node_budget:
+            return estimate(nb_candidates)
+
+        stored = self.transpositions.get((candidates, depth))
+        if stored is not None and (stored[1] or stored[0] >= beta):
+            return stored[0]
+        self.nodes += 1
+
+        best = beta
+        for _, subset_index, blocks in self.__moves(candidates):
+            move_cost = cost(1, len(self.subsets[subset_index]))
+            if move_cost + estimate(max(popcount(block) for block in blocks)) >= best:
+                continue
+            worst = 0
+            for block in sorted(blocks, key=popcount, reverse=True):
+                worst = max(worst, move_cost + self.evaluate(block, depth - 1, best - move_cost))
+                if worst >= best:
+                    break
+            best = min(best, worst)
+
+        if self.nodes >= self.node_budget:
+            # the subtree was cut by the budget: its cost is an estimate, not stored
+            return best
+        if best >= beta:
+            # every move was pruned: beta is a lower bound of the cost
+            self.transpositions[(candidates, depth)] = (beta, False)
+            return beta
+        self.transpositions[(candidates, depth)] = (best, True)
+        return best
+
+    def search(self, tables: Tables, masks: Masks, candidates: int, subsets: Sequence[tuple[int, ...]],
+               progress: Optional[Progress] = None) -> tuple[int, int]:
+        """ Returns the (try, subset) with the lowest worst case cost over the next rounds
+
+        Returned values are the combinaison index of the try and the position in subsets.
+        progress is called after each move searched.
+        """
+        self.__bind(tables, masks, subsets)
+        self.nodes = 0
+        best_cost = UNBOUNDED
+        solution = None
+        moves = self.__moves(candidates)
+        for move_index, (try_index, subset_index, blocks) in enumerate(moves):
+            move_cost = cost(1, len(subsets[subset_index]))
+            worst = 0
+            for block in sorted(blocks, key=popcount, reverse=True):
+                worst = max(worst, move_cost + self.evaluate(block, self.depth - 1, best_cost - move_cost))
+                if worst >= best_cost:
+                    break
+            if worst < best_cost:
+                best_cost = worst
+                solution = (try_index, subset_index)
+            if progress is not None:
+                progress(move_index + 1, len(moves))
+        if solution is None:
+            # nothing splits the candidates anymore, any try is as good
+            return next(bit_indexes(candidates)), 0
+        return solution
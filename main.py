@@ -2,9 +2,7 @@
 
 import tkinter as tk
 from visual import MainWindow
-from verificators import Compare, OccurenceVal, Smallest, Compare2
-from utils import Combi, Shape
-from game import Game
+from game import Game, main_game
 from solver import Solver
 
 
@@ -29,14 +27,9 @@ class Main:
 
 
 if __name__ == "__main__":
-    verif_a = Compare(Shape.CARRE, 4)
-    verif_b = OccurenceVal(3)
-    verif_c = Compare2(Shape.TRIANGLE, Shape.CARRE)
-    verif_d = Smallest()
-    new_game = Game(verif_a, verif_b, verif_c, verif_d)
-    new_game.set_solution(Combi(2, 4, 1))
+    new_game = main_game()
     # new_game.set_solution(Combi(4, 4, 3))
     # new_game.set_solution(Combi(5, 4, 5))
 
-    main_game = Main(new_game)
-    main_game.visualize()
+    main = Main(new_game)
+    main.visualize()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+
+""" Streaming replay and analysis of archived game histories
+
+Each input line is a game history (see history.py). Every round is replayed:
+the candidates are filtered with the recorded results, and the move played is
+compared to the solver's one from the same state. A query is wasted when it
+eliminates no candidate, and the rounds above the solver are counted against
+the solver playing the same game from the start. The summary is printed as
+JSON, and per game results can be written as JSON lines.
+"""
+
+import argparse
+import itertools
+import json
+import sys
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Iterable, Iterator, Optional, TextIO
+
+from cache import MoveCache
+from game import Game
+from solver import Solver, get_shared_solver, MAX_ROUNDS
+from utils import Combi
+
+CHUNK_SIZE = 64
+
+# per process: the moves of the solver
+_CACHE = MoveCache(max_size=65536)
+
+
+def get_solver(spec: dict) -> Solver:
+    """ Return a solver of the game definition after cleanup, the compiled game being shared with the previous ones """
+    game = Game.from_spec({key: value for key, value in spec.items() if key != "solution"})
+
+    def build() -> Solver:
+        solver = Solver(game, cache=_CACHE)
+        solver.cleanup_combinaisons()
+        return solver
+
+    return get_shared_solver(("replay", game.get_signature()), build).copy()
+
+
+def solver_rounds(solver: Solver) -> Optional[int]:
+    """ Return the rounds needed by the solver to finish, None if it doesn't """
+    rounds = 0
+    while not solver.is_finished() and rounds < MAX_ROUNDS:
+        solver.solve()
+        rounds += 1
+    return rounds if solver.is_finished() else None
+
+
+def analyze_history(record: dict) -> dict[str, Any]:
+    """ Replay a game history and return its analysis """
+    solver = get_solver(record["game"])
+    game = solver.game
+    solution = Combi.from_values(record["game"]["solution"], game.space) if record["game"].get("solution") is not None else None
+    # the start of the game, replayed by the solver after the history
+    solver.push()
+    verifs = solver.get_verifs()
+    result: dict[str, Any] = {"id": record.get("id"), "rounds": len(record["rounds"]), "queries": 0, "wasted_queries": 0,
+                              "optimal_moves": 0, "scored_moves": 0, "excess_candidates": 0, "consistent": True}
+
+    for number, played in enumerate(record["rounds"], 1):
+        if not played["verifs"]:
+            raise ValueError(f"Round {number} has no verificator")
+        combi = Combi.from_values(played["combi"], game.space)
+        tries = [(game.get_verificator(verif["slot"]), verif["result"]) for verif in played["verifs"]]
+        if solver.worlds is None and solver.possibles:
+            # worst case remaining candidates, of the move played and of the solver's move
+            cache = solver.get_partition_cache()
+            best_combi, best_verifs = solver.find_move("minmax")
+            best = max(cache.get_sizes(best_combi.index, tuple(verifs.index(verif) for verif in best_verifs)))
+            score = max(cache.get_sizes(combi.index, tuple(verifs.index(verif) for verif, _ in tries)))
+            result["scored_moves"] += 1
+            result["optimal_moves"] += score <= best
+            result["excess_candidates"] += max(score - best, 0)
+        for verif, res in tries:
+            before = len(solver.possibles)
+            solver.apply_result(verif, combi, res)
+            result["queries"] += 1
+            result["wasted_queries"] += len(solver.possibles) == before
+        if not solver.possibles or (solution is not None and solution not in solver.possibles):
+            # the results recorded can't come from this game
+            result["consistent"] = False
+            break
+
+    result["solved"] = len(solver.possibles) == 1
+    result["solver_rounds"] = None
+    if result["consistent"] and solver.worlds is None:
+        if solution is None and result["solved"]:
+            solution = next(iter(solver.possibles))
+        if solution is not None:
+            # the game is shared by the solvers of this process, which run one at a time
+            game.set_solution(solution)
+            solver.pop()
+            result["solver_rounds"] = solver_rounds(solver)
+    return result
+
+
+def analyze_lines(lines: list[str]) -> list[dict[str, Any]]:
+    """ Analyze a chunk of history lines, run in a worker """
+    results = []
+    for line in lines:
+        try:
+            results.append(analyze_history(json.loads(line)))
+        except (AssertionError, IndexError, KeyError, TypeError, ValueError) as error:
+            results.append({"id": None, "error": f"{type(error).__name__}: {error}"})
+    return results
+
+
+def iter_analyses(lines: Iterable[str], workers: int = 1, window: Optional[int] = None) -> Iterator[dict[str, Any]]:
+    """ Analyze every history line, yielding results in input order
+
+    Lines are sent to the workers by chunks, and at most window chunks are
+    in flight at once, so memory stays bounded whatever the archive size.
+    """
+    lines = (line for line in lines if line.strip())
+    chunks = iter(lambda: list(itertools.islice(lines, CHUNK_SIZE)), [])
+    if workers <= 1:
+        for chunk in chunks:
+            yield from analyze_lines(chunk)
+        return
+
+    window = window or 4 * workers
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending: deque[Future] = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(analyze_lines, chunk))
+            if len(pending) >= window:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+class ReplaySummary:
+    """ Aggregated analysis of the games replayed """
+    counters = ("games", "errors", "inconsistent", "solved", "rounds", "queries", "wasted_queries",
+                "scored_moves", "optimal_moves", "excess_candidates", "compared_games", "games_above_solver", "rounds_above_solver")
+
+    def __init__(self) -> None:
+        self.totals: dict[str, int] = dict.fromkeys(self.counters, 0)
+        # rounds above the solver -> number of games
+        self.rounds_above: dict[int, int] = {}
+
+    def add(self, result: dict[str, Any]) -> None:
+        """ Add the analysis of a game """
+        self.totals["games"] += 1
+        if "error" in result:
+            self.totals["errors"] += 1
+            return
+        self.totals["inconsistent"] += not result["consistent"]
+        self.totals["solved"] += result["solved"]
+        for key in ("rounds", "queries", "wasted_queries", "scored_moves", "optimal_moves", "excess_candidates"):
+            self.totals[key] += result[key]
+        if result["solved"] and result["solver_rounds"] is not None:
+            above = result["rounds"] - result["solver_rounds"]
+            self.totals["compared_games"] += 1
+            self.totals["games_above_solver"] += above > 0
+            self.totals["rounds_above_solver"] += max(above, 0)
+            self.rounds_above[above] = self.rounds_above.get(above, 0) + 1
+
+    def to_dict(self) -> dict[str, Any]:
+        """ Return the summary, with rates """
+        summary: dict[str, Any] = dict(self.totals)
+        summary["wasted_query_rate"] = self.totals["wasted_queries"] / max(self.totals["queries"], 1)
+        summary["optimal_move_rate"] = self.totals["optimal_moves"] / max(self.totals["scored_moves"], 1)
+        summary["rounds_above_solver_distribution"] = {str(above): count for above, count in sorted(self.rounds_above.items())}
+        return summary
+
+
+def run(input_file: TextIO, output_file: Optional[TextIO] = None, workers: int = 1) -> dict[str, Any]:
+    """ Analyze the histories of input_file, writing per game results to output_file, and return the summary """
+    summary = ReplaySummary()
+    for result in iter_analyses(input_file, workers):
+        summary.add(result)
+        if output_file is not None:
+            output_file.write(json.dumps(result) + "\n")
+    return summary.to_dict()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay and analyze archived game histories")
+    parser.add_argument("input", nargs="?", default="-", help="JSON lines game histories (default: stdin)")
+    parser.add_argument("-o", "--output", help="JSON lines analysis of every game")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="number of worker processes")
+    args = parser.parse_args()
+
+    input_stream = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    output_stream = open(args.output, "w", encoding="utf-8") if args.output is not None else None
+    try:
+        print(json.dumps(run(input_stream, output_stream, args.workers), indent=2))
+    finally:
+        if input_stream is not sys.stdin:
+            input_stream.close()
+        if output_stream is not None:
+            output_stream.close()
@@ -0,0 +1,222 @@
+""" Move search engines working on compiled verificator tables """
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Callable, Sequence, Optional
+
+from candidates import popcount
+from strategies import Strategy, MinMax, get_strategy
+
+Tables = Sequence[Sequence[int]]
+Masks = Sequence[Sequence[tuple[int, int]]]
+# called with the number of subsets searched and the total, it may raise SearchCancelled
+Progress = Callable[[int, int], None]
+# shards of the tries per worker of ParallelSearch, for finer progress reports
+SHARDS_PER_WORKER = 4
+# maximum number of (subset, solution, try) elements handled at once by numpy_search
+NUMPY_CHUNK_ELEMENTS = 1 << 22
+
+
+class SearchCancelled(Exception):
+    """ Raised by a progress callback to stop the move search """
+
+
+def distinct_tries(tables: Tables, tries: Sequence[int]) -> list[int]:
+    """ Return the first try of every group of tries giving the same results on all verificators
+
+    Such tries always split the candidates the same way, so only one of them
+    needs to be evaluated. This bounds the search by the number of result
+    combinations instead of the size of the code space.
+    """
+    seen = set()
+    representatives = []
+    for try_index, signature in zip(tries, zip(*[[table[try_index] for try_index in tries] for table in tables])):
+        if signature not in seen:
+            seen.add(signature)
+            representatives.append(try_index)
+    return representatives
+
+
+class PartitionCache:
+    """ Partitions of the candidates for every (try, verificator subset)
+
+    Subsets are handled as a prefix tree: the partition of (A, B, C) is the
+    partition of (A, B) refined by C, so it is computed from the cached
+    partition of its parent instead of from scratch. Partitions only depend
+    on the results of the try for the subset, so they are shared between
+    tries giving the same results.
+    """
+    def __init__(self, tables: Tables, masks: Masks, candidates: int) -> None:
+        self.tables = tables
+        self.masks = masks
+        self.candidates = candidates
+        self.partitions: dict[tuple[tuple[int, ...], tuple[int, ...]], list[int]] = {}
+        self.sizes: dict[tuple[tuple[int, ...], tuple[int, ...]], list[int]] = {}
+
+    def get_partition(self, try_index: int, subset: tuple[int, ...]) -> list[int]:
+        """ Return the non empty blocks of candidates that can't be told apart by subset with try_index """
+        return self.__get_partition(subset, tuple(self.tables[verif][try_index] for verif in subset))
+
+    def __get_partition(self, subset: tuple[int, ...], codes: tuple[int, ...]) -> list[int]:
+        key = (subset, codes)
+        partition = self.partitions.get(key)
+        if partition is None:
+            parent = self.__get_partition(subset[:-1], codes[:-1]) if len(subset) > 1 else [self.candidates]
+            false_mask, true_mask = self.masks[subset[-1]][codes[-1]]
+            partition = [block for parent_block in parent for block in (parent_block & true_mask, parent_block & false_mask) if block]
+            self.partitions[key] = partition
+        return partition
+
+    def get_sizes(self, try_index: int, subset: tuple[int, ...]) -> list[int]:
+        """ Return the sizes of the blocks of the partition """
+        codes = tuple(self.tables[verif][try_index] for verif in subset)
+        sizes = self.sizes.get((subset, codes))
+        if sizes is None:
+            sizes = [popcount(block) for block in self.__get_partition(subset, codes)]
+            self.sizes[(subset, codes)] = sizes
+        return sizes
+
+
+def python_search(cache: PartitionCache, tries: Sequence[int], subsets: Sequence[tuple[int, ...]], strategy: Strategy = MinMax(),
+                  progress: Optional[Progress] = None) -> tuple[int, int]:
+    """ Returns the (try, subset) with the lowest score for strategy
+
+    tries holds combinaison indexes and subsets the verificator indexes to use.
+    Returned values are the combinaison index of the try and the position in
+    subsets; ties are broken by the first subset, then the first try.
+    """
+    best_score: Optional[float] = None
+    solution = None
+    tries = distinct_tries(cache.tables, tries)
+    for subset_index, subset in enumerate(subsets):
+        for try_index in tries:
+            score = strategy.score(cache.get_sizes(try_index, subset))
+            if best_score is None or score < best_score:
+                best_score = score
+                solution = (try_index, subset_index)
+        if progress is not None:
+            progress(subset_index + 1, len(subsets))
+    assert solution is not None
+    return solution
+
+
+def _search_shard(tables: Tables, masks: Masks, candidates: int, tries: Sequence[int], subsets: Sequence[tuple[int, ...]],
+                  strategy_name: str) -> tuple[float, int, int]:
+    """ Returns the (score, subset, try) minimum for a shard of tries, run in a worker """
+    cache = PartitionCache(tables, masks, candidates)
+    strategy = get_strategy(strategy_name)
+    return min((strategy.score(cache.get_sizes(try_index, subset)), subset_index, try_index)
+               for subset_index, subset in enumerate(subsets) for try_index in tries)
+
+
+class ParallelSearch:
+    """ Process pool sharing the move search between workers
+
+    Workers only receive the compiled tables, masks and candidates bitset.
+    Each worker gets a shard of the tries for every subset, so the prefix
+    sharing of PartitionCache still applies, and shard results are reduced
+    on (score, subset, try): the chosen move does not depend on the number
+    of workers. The pool is kept between calls until close().
+    """
+    def __init__(self, workers: int) -> None:
+        assert workers > 0
+        self.workers = workers
+        self.executor: Optional[ProcessPoolExecutor] = None
+        # memory-mapped tables (compiled game files) -> their copy sent to the workers
+        self.copies: dict[int, tuple[memoryview, tuple[int, ...]]] = {}
+
+    def __picklable(self, table: Sequence[int]) -> Sequence[int]:
+        """ Return table, or a tuple copy of it, made once, if it is a memoryview, which can't be pickled """
+        if not isinstance(table, memoryview):
+            return table
+        if id(table) not in self.copies:
+            self.copies[id(table)] = (table, tuple(table))
+        return self.copies[id(table)][1]
+
+    def search(self, tables: Tables, masks: Masks, candidates: int, tries: Sequence[int], subsets: Sequence[tuple[int, ...]],
+               strategy: Strategy = MinMax(), progress: Optional[Progress] = None) -> tuple[int, int]:
+        """ Same as python_search, computed by the pool, progress being called after each shard """
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        tries = distinct_tries(tables, tries)
+        tables = [self.__picklable(table) for table in tables]
+        nb_shards = min(self.workers * SHARDS_PER_WORKER, len(tries))
+        futures = [self.executor.submit(_search_shard, tables, masks, candidates, tries[start::nb_shards], subsets, strategy.name)
+                   for start in range(nb_shards)]
+        results = []
+        try:
+            for future in as_completed(futures):
+                results.append(future.result())
+                if progress is not None:
+                    progress(len(results), nb_shards)
+        except BaseException:
+            # the shards not started yet are dropped, the running ones end in the background
+            for future in futures:
+                future.cancel()
+            raise
+        _, subset_index, try_index = min(results)
+        return try_index, subset_index
+
+    def close(self) -> None:
+        """ Stop the workers """
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+
+def numpy_search(tables: Tables, candidates: Sequence[int], subsets: Sequence[Sequence[int]], strategy: Strategy = MinMax(),
+                 progress: Optional[Progress] = None) -> tuple[int, int]:
+    """ Returns the (try, subset) with the lowest score for strategy, with numpy
+
+    tables holds the result codes of each verificator, candidates the indexes
+    of the remaining combinaisons and subsets the verificator indexes to use.
+    Returned values are the combinaison index of the try and the position in
+    subsets; ties are broken like python_search. progress is called with the
+    number of distinct tries evaluated after each chunk.
+    """
+    # imported here as numpy is only needed by the numpy engine
+    try:
+        import numpy as np
+    except ImportError as error:
+        raise ImportError("The numpy engine requires numpy to be installed") from error
+
+    # result codes of the remaining combinaisons, shape (verificator, combinaison)
+    codes = np.asarray(tables, dtype=np.int8)[:, np.asarray(candidates, dtype=np.intp)]
+
+    # combinaisons with the same results on every verificator behave the same,
+    # both as solutions (counted with their weight) and as tries (first one kept)
+    signatures, firsts, weights = np.unique(codes, axis=1, return_index=True, return_counts=True)
+    nb_signatures = signatures.shape[1]
+
+    # tries are handled by chunks, so that the (solution, try) arrays stay small
+    nb_keys = 1 << max(len(subset) for subset in subsets)
+    chunk_size = max(1, NUMPY_CHUNK_ELEMENTS // (len(subsets) * nb_signatures))
+    scores = np.empty((len(subsets), nb_signatures), dtype=np.float64)
+    for start in range(0, nb_signatures, chunk_size):
+        tries = signatures[:, start:start + chunk_size]
+        # same[v, s, t] is True when verificator v gives the same result for solution s and try t
+        same = signatures[:, :, None] == tries[:, None, :]
+        # weight of the solutions answering True to every verificator of a group, for each try,
+        # the groups being shared by the subsets containing them
+        products: dict[tuple[int, ...], Any] = {}
+        totals: dict[tuple[int, ...], Any] = {(): np.full(tries.shape[1], weights.sum())}
+        sizes = np.zeros((len(subsets), tries.shape[1], nb_keys), dtype=np.int64)
+        for index, subset in enumerate(subsets):
+            groups = [tuple(verif for position, verif in enumerate(subset) if mask >> position & 1) for mask in range(1 << len(subset))]
+            for group in groups:
+                if group not in totals:
+                    products[group] = same[group[0]] if len(group) == 1 else products[group[:-1]] & same[group[-1]]
+                    totals[group] = np.einsum("st,s->t", products[group], weights)
+            # size of the block of each answers, the True ones being given by key, by inclusion-exclusion
+            for key in range(1 << len(subset)):
+                for mask in range(1 << len(subset)):
+                    if mask & key == key:
+                        sign = -1 if bin(mask ^ key).count("1") % 2 else 1
+                        sizes[index, :, key] += sign * totals[groups[mask]]
+        scores[:, start:start + tries.shape[1]] = strategy.score_array(sizes)
+        if progress is not None:
+            progress(start + tries.shape[1], nb_signatures)
+
+    # ties: first subset, then first try in combinaison order
+    best_subset = int(np.argmax((scores == scores.min()).any(axis=1)))
+    try_positions = np.where(scores[best_subset] == scores.min(), firsts, len(candidates))
+    return int(candidates[int(try_positions.min())]), best_subset
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+
+""" Local JSON over HTTP solver service
+
+    POST   /sessions                  game definition (as batch.py) -> {"session": id, "candidates": n}
+    GET    /sessions/<id>/move        -> {"combi": [2, 4, 1], "verifs": ["A", "C"]}
+    POST   /sessions/<id>/results     {"combi": [2, 4, 1], "results": [{"slot": "A", "result": true}, ...]}
+                                      -> {"candidates": n, "finished": false}
+    GET    /sessions/<id>/candidates  -> {"candidates": [[2, 4, 1], ...]}
+    DELETE /sessions/<id>
+    GET    /metrics                   -> requests, latency percentiles and throughput per route
+
+The rounds of each session can be archived, as histories written when the session ends (see history.py).
+"""
+
+import argparse
+import itertools
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Optional, TextIO
+
+from game import Game
+from history import GameHistory
+from solver import Solver, MAX_QUERIES
+from utils import Combi
+
+MAX_SESSIONS = 10000
+MAX_GAMES = 256
+LATENCY_WINDOW = 1000
+
+
+class ServiceError(Exception):
+    """ Error returned to the client with an HTTP status """
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+def find_move(solver: Solver) -> tuple[int, list[str]]:
+    """ Return the combinaison index and verificator slots of the best move, run in a worker """
+    combi, verifs = solver.min_max_solve()
+    return combi.index, [verif.get_slot() for verif in verifs]
+
+
+class Session:
+    """ Solver state of a client, its requests being handled one at a time """
+    def __init__(self, solver: Solver, history: GameHistory) -> None:
+        self.solver = solver
+        self.history = history
+        self.lock = threading.Lock()
+
+
+class ServiceMetrics:
+    """ Request counts, errors and latencies of the last requests, per route """
+    def __init__(self) -> None:
+        self.start = time.perf_counter()
+        self.lock = threading.Lock()
+        self.requests: dict[str, int] = {}
+        self.errors: dict[str, int] = {}
+        self.latencies: dict[str, deque[float]] = {}
+
+    def record(self, route: str, duration: float, error: bool) -> None:
+        """ Record a request to route """
+        with self.lock:
+            self.requests[route] = self.requests.get(route, 0) + 1
+            if error:
+                self.errors[route] = self.errors.get(route, 0) + 1
+            self.latencies.setdefault(route, deque(maxlen=LATENCY_WINDOW)).append(duration)
+
+    def to_dict(self) -> dict[str, Any]:
+        """ Return the metrics, latencies in milliseconds """
+        with self.lock:
+            uptime = time.perf_counter() - self.start
+            routes = {}
+            for route, count in self.requests.items():
+                latencies = sorted(self.latencies[route])
+                routes[route] = {
+                    "requests": count,
+                    "errors": self.errors.get(route, 0),
+                    "throughput": count / uptime,
+                    **{f"p{percent}": latencies[min(len(latencies) - 1, len(latencies) * percent // 100)] * 1000 for percent in (50, 95, 99)},
+                    "max": latencies[-1] * 1000,
+                }
+            return {"uptime": uptime, "requests": sum(self.requests.values()), "throughput": sum(self.requests.values()) / uptime, "routes": routes}
+
+
+class SolverService:
+    """ Sessions of the service
+
+    Games are compiled and cleaned up once per signature, then every session
+    of the same game starts from a copy of that solver; the solvers of the
+    max_games games used last are kept. Move searches run in
+    the executor, so they don't hold the server threads' interpreter.
+    """
+    def __init__(self, executor: Executor, max_sessions: int = MAX_SESSIONS, history: Optional[TextIO] = None,
+                 max_games: int = MAX_GAMES) -> None:
+        self.executor = executor
+        self.max_sessions = max_sessions
+        self.max_games = max_games
+        self.history = history
+        self.history_lock = threading.Lock()
+        self.games: OrderedDict[str, Solver] = OrderedDict()
+        self.sessions: OrderedDict[str, Session] = OrderedDict()
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.metrics = ServiceMetrics()
+
+    def get_game(self, spec: dict) -> Solver:
+        """ Return the cleaned up solver of the game definition, shared by its sessions """
+        game = Game.from_spec({key: value for key, value in spec.items() if key != "solution"})
+        signature = game.get_signature()
+        with self.lock:
+            solver = self.games.get(signature)
+            if solver is not None:
+                self.games.move_to_end(signature)
+        if solver is None:
+            solver = Solver(game)
+            solver.cleanup_combinaisons()
+            with self.lock:
+                solver = self.games.setdefault(signature, solver)
+                self.games.move_to_end(signature)
+                if len(self.games) > self.max_games:
+                    self.games.popitem(last=False)
+        return solver
+
+    def get_session(self, session_id: str) -> Session:
+        """ Return the session of given id """
+        with self.lock:
+            session = self.sessions.get(session_id)
+        if session is None:
+            raise ServiceError(404, f"Session {session_id} does not exist")
+        return session
+
+    def create_session(self, spec: dict) -> dict:
+        """ Create a session playing the game definition """
+        solver = self.get_game(spec).copy()
+        dropped = None
+        with self.lock:
+            session_id = str(next(self.ids))
+            self.sessions[session_id] = Session(solver, GameHistory(solver.game, session_id))
+            if len(self.sessions) > self.max_sessions:
+                # the oldest session is dropped
+                _, dropped = self.sessions.popitem(last=False)
+        if dropped is not None:
+            self.archive(dropped)
+        return {"session": session_id, "candidates": len(solver.possibles)}
+
+    def delete_session(self, session_id: str) -> dict:
+        """ Delete a session """
+        with self.lock:
+            session = self.sessions.pop(session_id, None)
+        if session is None:
+            raise ServiceError(404, f"Session {session_id} does not exist")
+        self.archive(session)
+        return {}
+
+    def archive(self, session: Session) -> None:
+        """ Write the history of an ended session, if histories are archived """
+        if self.history is not None and session.history.rounds:
+            with self.history_lock:
+                session.history.write(self.history)
+
+    def get_move(self, session_id: str) -> dict:
+        """ Return the best move of the session """
+        session = self.get_session(session_id)
+        with session.lock:
+            if not session.solver.possibles:
+                raise ServiceError(409, "No candidate is left")
+            index, slots = self.executor.submit(find_move, session.solver).result()
+        return {"combi": list(Combi.from_index(index, session.solver.game.space).values), "verifs": slots}
+
+    def add_results(self, session_id: str, body: dict) -> dict:
+        """ Apply the verificator results of a try to the session """
+        session = self.get_session(session_id)
+        solver = session.solver
+        combi = Combi.from_values(body["combi"], solver.game.space)
+        results = [(solver.game.get_verificator(result["slot"]), result["result"]) for result in body["results"]]
+        if not 1 <= len(results) <= MAX_QUERIES:
+            raise ValueError(f"A round has 1 to {MAX_QUERIES} results")
+        if any(not isinstance(res, bool) for _, res in results):
+            raise ValueError("Results must be true or false")
+        with session.lock:
+            for verif, res in results:
+                solver.apply_result(verif, combi, res)
+            solver.solved = len(solver.possibles) == 1
+            session.history.record_round(combi, results)
+            session.history.solved = solver.solved
+            return {"candidates": len(solver.possibles), "finished": solver.is_finished()}
+
+    def get_candidates(self, session_id: str) -> dict:
+        """ Return the remaining combinaisons of the session """
+        session = self.get_session(session_id)
+        with session.lock:
+            return {"candidates": [list(combi.values) for combi in session.solver.possibles]}
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """ Route the requests to the service of the server """
+    server: "SolverServer"
+
+    def log_message(self, format: str, *args: Any) -> None:  # pylint: disable=redefined-builtin
+        # the metrics replace the access log, which would slow load tests down
+        pass
+
+    def read_body(self) -> dict:
+        """ Return the JSON body of the request """
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if not isinstance(body, dict):
+            raise ValueError("The body must be a JSON object")
+        return body
+
+    def handle_request(self, method: str) -> None:
+        """ Dispatch the request and write its JSON response """
+        start = time.perf_counter()
+        service = self.server.service
+        parts = [part for part in self.path.split("?")[0].split("/") if part]
+        route = f"{method} /{'/'.join(parts[:1] + ['<id>'] * (len(parts) > 1) + parts[2:])}"
+        status = 200
+        try:
+            if method == "GET" and parts == ["metrics"]:
+                response = service.metrics.to_dict()
+                response["sessions"] = len(service.sessions)
+                response["games"] = len(service.games)
+            elif method == "POST" and parts == ["sessions"]:
+                response = service.create_session(self.read_body())
+                status = 201
+            elif method == "DELETE" and len(parts) == 2 and parts[0] == "sessions":
+                response = service.delete_session(parts[1])
+            elif method == "GET" and len(parts) == 3 and parts[0] == "sessions" and parts[2] == "move":
+                response = service.get_move(parts[1])
+            elif method == "POST" and len(parts) == 3 and parts[0] == "sessions" and parts[2] == "results":
+                response = service.add_results(parts[1], self.read_body())
+            elif method == "GET" and len(parts) == 3 and parts[0] == "sessions" and parts[2] == "candidates":
+                response = service.get_candidates(parts[1])
+            else:
+                # unknown paths share a route, so that they don't grow the metrics
+                route = f"{method} <unknown>"
+                raise ServiceError(404, f"No route for {method} {self.path}")
+        except ServiceError as error:
+            status, response = error.status, {"error": str(error)}
+        except (AssertionError, KeyError, TypeError, ValueError) as error:
+            status, response = 400, {"error": f"{type(error).__name__}: {error}"}
+
+        data = json.dumps(response).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        service.metrics.record(route, time.perf_counter() - start, status >= 400)
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        self.handle_request("GET")
+
+    def do_POST(self) -> None:  # pylint: disable=invalid-name
+        self.handle_request("POST")
+
+    def do_DELETE(self) -> None:  # pylint: disable=invalid-name
+        self.handle_request("DELETE")
+
+
+class SolverServer(ThreadingHTTPServer):
+    """ HTTP server of a SolverService, one thread per connection """
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], workers: Optional[int] = None, max_sessions: int = MAX_SESSIONS,
+                 history: Optional[TextIO] = None, max_games: int = MAX_GAMES) -> None:
+        super().__init__(address, RequestHandler)
+        self.service = SolverService(ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1), max_sessions, history, max_games)
+
+    def server_close(self) -> None:
+        super().server_close()
+        self.service.executor.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the solver over HTTP")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("-p", "--port", type=int, default=8080, help="port to listen on")
+    parser.add_argument("-w", "--workers", type=int, help="number of move search processes (default: number of CPUs)")
+    parser.add_argument("--max-sessions", type=int, default=MAX_SESSIONS, help="oldest sessions are dropped above this number")
+    parser.add_argument("--max-games", type=int, default=MAX_GAMES, help="solvers of the least recently used games are dropped above this number")
+    parser.add_argument("--history", help="JSON lines file the histories of ended sessions are appended to")
+    args = parser.parse_args()
+
+    history_stream = open(args.history, "a", encoding="utf-8") if args.history is not None else None
+    with SolverServer((args.host, args.port), args.workers, args.max_sessions, history_stream, args.max_games) as server:
+        print(f"Serving on http://{args.host}:{args.port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    if history_stream is not None:
+        history_stream.close()
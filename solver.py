@@ -3,25 +3,89 @@
 """ Solver for the game """
 
 import itertools
-from typing import Literal, Tuple, Optional
+import os
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, Literal, Tuple, Optional
 
-from verificators import Verificator, Compare, OccurenceVal, Smallest, Compare2
+from verificators import Verificator, Compare, OccurenceVal, Smallest, Compare2, MultiCriterion, NO_RESULT
+from candidates import CandidateSet
 from game import Game
-from utils import Combi, Verifs, Shape
+from cache import MoveCache
+from stats import SolverStats
+from search import PartitionCache, ParallelSearch, Progress, python_search, numpy_search
+from strategies import get_strategy
+from lookahead import LookaheadSearch
+from worlds import WorldSet
+from history import GameHistory
+from utils import Combi, Shape
+
+# verificators a combinaison can be tested against in a round
+MAX_QUERIES = 3
+# rounds after which the tools give up on a game the solver doesn't finish
+MAX_ROUNDS = 25
+# solvers kept by get_shared_solver
+MAX_GAMES = 256
+
+# candidates bits, worlds, solved flag and number of rounds in the history
+SolverState = tuple[int, Optional[dict], bool, int]
 
 class Solver:
     """ Define a solver for a game """
     combi: Combi
     combi_use: Literal[0, 1, 2, 3] = 0
-    possibles: set[Combi]
+    possibles: CandidateSet
     results: list[tuple]
     solved: bool = False
+    engines = ("python", "numpy", "parallel")
+    partition_cache: Optional[PartitionCache] = None
+    parallel: Optional[ParallelSearch] = None
+    worlds: Optional[WorldSet] = None
 
-    def __init__(self, game: Game) -> None:
+    def __init__(self, game: Game, engine: str = "python", workers: Optional[int] = None, cache: Optional[MoveCache] = None,
+                 stats: Optional[SolverStats] = None, strategy: str = "minmax", lookahead: Optional[LookaheadSearch] = None,
+                 history: Optional[GameHistory] = None) -> None:
+        if engine not in self.engines:
+            raise ValueError(f"Engine {engine} is not valid")
         self.game = game
-        self.possibles = set(map(lambda t: Combi(*t), itertools.product([1, 2, 3, 4, 5], repeat=3)))
-        self.results = list(itertools.product(*[verificator.get_results() for verificator in self.get_verifs()]))
+        self.engine = engine
+        self.strategy = get_strategy(strategy).name
+        self.lookahead = lookahead
+        self.cache = cache
+        self.stats = stats
+        self.history = history
+        self.states: list[SolverState] = []
+        if stats is not None:
+            for verif in self.get_verifs():
+                stats.attach(verif)
+        if engine == "parallel":
+            self.parallel = ParallelSearch(workers or os.cpu_count() or 1)
+        self.possibles = CandidateSet.full(game.space)
+        # results of the verificators given by some combinaison, found by cleanup_combinaisons
+        self.results = []
         self.all_combis = self.possibles.copy()
+        if any(isinstance(verif, MultiCriterion) for verif in self.get_verifs()):
+            # the active criteria are unknown: track every possible world
+            self.worlds = WorldSet(self.get_verifs(), self.possibles.get_bits())
+
+    def copy(self) -> "Solver":
+        """ Return a solver of the same game in the same state, sharing the compiled verificators """
+        solver = Solver(self.game, self.engine, self.parallel.workers if self.parallel is not None else None, self.cache,
+                        None, self.strategy, self.lookahead)
+        solver.possibles = self.possibles.copy()
+        solver.results = list(self.results)
+        solver.solved = self.solved
+        if self.worlds is not None:
+            solver.worlds = self.worlds.copy()
+        return solver
+
+    def close(self) -> None:
+        """ Release the resources used by the solver """
+        if self.parallel is not None:
+            self.parallel.close()
+        if self.stats is not None:
+            for verif in self.get_verifs():
+                self.stats.detach(verif)
 
     def is_finished(self) -> bool:
         """ Check if the game is finished """
@@ -29,7 +93,7 @@ class Solver:
 
     def get_verifs(self) -> list[Verificator]:
         """ Get verificators """
-        return [list(verif.values())[0] for verif in self.game.list_verificators()]
+        return self.game.get_verificators()
 
     def set_combinaison(self, combinaison: Combi) -> None:
         """ Set the combinaison to verify """
@@ -39,20 +103,61 @@ class Solver:
 
     def verify(self, choice: Verificator) -> bool:
         """ Verify the combinaison for the verificator """
-        if self.combi_use == 3:
-            raise ValueError("Combinaison used 3 times already")
+        if self.combi_use == MAX_QUERIES:
+            raise ValueError(f"Combinaison used {MAX_QUERIES} times already")
         self.combi_use += 1
 
         # print(f"    - {choice}")
         res = choice.verify(self.game.solution, self.combi)
-        choice.discard(self.possibles, self.combi, res)
-
+        self.apply_result(choice, self.combi, res)
         return res
 
-    def solve(self):
-        """ Solve the game """
-        best_combi, best_verifs = self.min_max_solve()
+    def push(self) -> None:
+        """ Save the candidate state, restored by pop
+
+        The candidates are an immutable int and the worlds are replaced, not
+        modified, by each result: a state is saved without copying them.
+        """
+        worlds = self.worlds.worlds if self.worlds is not None else None
+        rounds = len(self.history.rounds) if self.history is not None else 0
+        self.states.append((self.possibles.get_bits(), worlds, self.solved, rounds))
+
+    def pop(self) -> None:
+        """ Restore the candidate state saved by the last push, undoing the results applied since """
+        if not self.states:
+            raise ValueError("No state to restore")
+        bits, worlds, solved, rounds = self.states.pop()
+        self.possibles.bits = bits
+        if self.worlds is not None:
+            self.worlds.worlds = worlds
+        self.solved = solved
+        if self.history is not None:
+            self.history.truncate(rounds)
+            self.history.solved = solved
+
+    def get_depth(self) -> int:
+        """ Return the number of states saved """
+        return len(self.states)
+
+    def apply_result(self, choice: Verificator, combinaison: Combi, res: bool) -> None:
+        """ Discard the combinaisons that don't give res for combinaison with the verificator """
+        before = len(self.possibles) if self.stats is not None else 0
+        if self.worlds is not None:
+            self.worlds.discard(self.get_verifs().index(choice), combinaison.index, res)
+            self.possibles.intersect(self.worlds.get_candidates())
+        else:
+            choice.discard(self.possibles, combinaison, res)
+        if self.stats is not None:
+            self.stats.record_verification(choice.get_slot(), res, before, len(self.possibles))
+
+    def solve(self, strategy: Optional[str] = None):
+        """ Solve the game, choosing the move with strategy (the solver's one by default) """
+        return self.play_move(*self.find_move(strategy))
+
+    def play_move(self, best_combi: Combi, best_verifs: tuple[Verificator, ...]):
+        """ Verify best_combi with best_verifs, a move returned by find_move, undone by pop """
         tries = []
+        self.push()
 
         self.set_combinaison(best_combi)
         for verif in best_verifs:
@@ -61,83 +166,147 @@ class Solver:
 
         if len(self.possibles) == 1:
             self.solved = True
+        if self.stats is not None:
+            self.stats.end_move(best_combi, [verif.get_slot() for verif in best_verifs])
+        if self.history is not None:
+            self.history.record_round(best_combi, tries)
+            self.history.solved = self.solved
         return best_combi, tries
 
-    def min_max_solve(self) -> Tuple[Combi, tuple[Verificator, ...]]:
-        """ Returns the best choice possible for a given state """
-        min_max_value = 125
-        solution_combi = None
-        solution_verifs = None
-
-        # get all combinations of verificators (len 1, 2 or 3)
+    def get_verifs_combinations(self) -> list[tuple[Verificator, ...]]:
+        """ Get all combinations of verificators (len 1, 2 or 3) """
         verifs = self.get_verifs()
-        all_verifs_combine: list[tuple[Verificator]] = []
-        for repeat in range(1, 4):
+        all_verifs_combine: list[tuple[Verificator, ...]] = []
+        for repeat in range(1, MAX_QUERIES + 1):
             combinations = itertools.combinations(verifs, repeat)
             all_verifs_combine.extend(combinations)
+        return all_verifs_combine
 
-        # loop throug verificators
-        for possible_verif in all_verifs_combine:
-            max_remaining = 0
-            possible_solution = None
+    def get_partition_cache(self) -> PartitionCache:
+        """ Return the partition cache, dropped when the possibles changed """
+        if self.partition_cache is None or self.partition_cache.candidates != self.possibles.get_bits():
+            verifs = self.get_verifs()
+            self.partition_cache = PartitionCache(
+                [verif.get_table() for verif in verifs],
+                [verif.get_masks() for verif in verifs],
+                self.possibles.get_bits(),
+            )
+        return self.partition_cache
 
-            # loop through possible combi
-            for possible_try in self.possibles:
-
-                # get all solution for given choices
-                for possible_solution in self.possibles:
-                    try_combi = self.possibles.copy()
-
-                    for verif in possible_verif:
-                        solution_res = verif.get_res(possible_solution)
-                        try_res = verif.get_res(possible_solution)
-                        verif.make_try(try_combi, try_res, try_res == solution_res)
-
-                    # if impossible combinaison, exit
-                    if not try_combi:
-                        continue
+    def min_max_solve(self) -> Tuple[Combi, tuple[Verificator, ...]]:
+        """ Returns the best choice possible for a given state """
+        return self.find_move("minmax")
 
-                    if len(try_combi) > max_remaining:
-                        max_remaining = len(try_combi)
-                        for new_sol in try_combi:
-                            break
-                        possible_solution = new_sol
+    def find_move(self, strategy: Optional[str] = None, progress: Optional[Progress] = None) -> Tuple[Combi, tuple[Verificator, ...]]:
+        """ Returns the best choice for strategy in the current state
 
-            if max_remaining < min_max_value:
-                min_max_value = max_remaining
-                solution_combi = possible_solution
-                solution_verifs = possible_verif
+        Without strategy, the lookahead search is used if the solver has one,
+        else the solver's strategy. progress is called as the search advances:
+        after each verificator subset by the python and worlds searches, each
+        chunk of tries by the numpy one, each shard by the parallel one and
+        each move searched by the lookahead.
+        """
+        move_strategy = get_strategy(strategy or self.strategy)
+        use_lookahead = strategy is None and self.lookahead is not None and self.worlds is None
+        # with unknown criteria, the candidates alone don't identify the state
+        use_cache = self.cache is not None and self.worlds is None
+        if use_cache:
+            # minmax moves are keyed by the game signature alone, other searches are prefixed
+            signature = self.game.get_signature()
+            if use_lookahead:
+                signature = f"{self.lookahead.get_name()}:{signature}"
+            elif move_strategy.name != "minmax":
+                signature = f"{move_strategy.name}:{signature}"
+            move = self.cache.get(signature, self.possibles.get_bits())
+            if move is not None:
+                if self.stats is not None:
+                    self.stats.record_search("cache", 0, 0, 0, 0, 0.0)
+                return Combi.from_index(move[0], self.game.space), tuple(self.game.get_verificator(slot) for slot in move[1])
 
-        assert solution_combi is not None and solution_verifs is not None
-        return solution_combi, solution_verifs
+        start = time.perf_counter()
+        verifs = self.get_verifs()
+        all_verifs_combine = self.get_verifs_combinations()
+        subsets = [tuple(verifs.index(verif) for verif in subset) for subset in all_verifs_combine]
+        tries = list(self.possibles.indexes())
+        partitions = blocks = 0
 
+        if self.worlds is not None:
+            best_try, best_subset = self.worlds.search(tries, subsets, move_strategy, progress)
+        elif use_lookahead:
+            best_try, best_subset = self.lookahead.search(
+                [verif.get_table() for verif in verifs],
+                [verif.get_masks() for verif in verifs],
+                self.possibles.get_bits(),
+                subsets,
+                progress,
+            )
+        elif self.engine == "numpy":
+            best_try, best_subset = numpy_search([verif.get_table() for verif in verifs], tries, subsets, move_strategy, progress)
+        elif self.parallel is not None:
+            best_try, best_subset = self.parallel.search(
+                [verif.get_table() for verif in verifs],
+                [verif.get_masks() for verif in verifs],
+                self.possibles.get_bits(),
+                tries,
+                subsets,
+                move_strategy,
+                progress,
+            )
+        else:
+            partition_cache = self.get_partition_cache()
+            cached = set(partition_cache.partitions) if self.stats is not None else set()
+            best_try, best_subset = python_search(partition_cache, tries, subsets, move_strategy, progress)
+            if self.stats is not None:
+                computed = [partition for key, partition in partition_cache.partitions.items() if key not in cached]
+                partitions, blocks = len(computed), sum(len(partition) for partition in computed)
 
-    def __get_results(self, combi: Combi) -> Optional[list]:
-        """ Get the results for a combinaison """
-        list_results = []
-        for verif in self.get_verifs():
-            result = verif.get_res(combi)
-            if result is None:
-                return None
-            list_results.append(result)
-        return list_results
+        if self.stats is not None:
+            engine = "worlds" if self.worlds is not None else "lookahead" if use_lookahead else self.engine
+            self.stats.record_search(engine, len(subsets), len(tries), partitions, blocks, time.perf_counter() - start)
+        if use_cache:
+            self.cache.put(signature, self.possibles.get_bits(), (best_try, tuple(verif.get_slot() for verif in all_verifs_combine[best_subset])))
+        return Combi.from_index(best_try, self.game.space), all_verifs_combine[best_subset]
 
     def cleanup_combinaisons(self):
         """ Assign each combinaisons to the results of verificators """
-        matrix = {}
-        for result in self.results:
-            matrix[result] = []
-
-        for combi in self.all_combis:
-            results = self.__get_results(combi)
-            if results is None:
-                self.possibles.remove(combi)
+        if self.worlds is not None:
+            self.worlds.cleanup()
+            self.possibles.intersect(self.worlds.get_candidates())
+            return
+        verifs = self.get_verifs()
+        matrix: dict[tuple[int, ...], list[int]] = {}
+        to_remove = 0
+
+        # work on the result codes, so that no combinaison is built
+        all_combis = self.all_combis.get_bits()
+        for index, codes in enumerate(zip(*[verif.get_table() for verif in verifs])):
+            if not all_combis >> index & 1:
+                continue
+            if NO_RESULT in codes:
+                to_remove |= 1 << index
                 continue
-            matrix[tuple(results)].append(combi)
-
-        for i, v in matrix.items():
-            if len(v) == 0:
-                self.results.remove(i)
-            if len(v) > 1:
-                for combi in v:
-                    self.possibles.remove(combi)
+            matrix.setdefault(codes, []).append(index)
+
+        # in the order of the product of the verificators' results
+        self.results = [tuple(verif.get_results()[code] for verif, code in zip(verifs, codes)) for codes in sorted(matrix)]
+        for indexes in matrix.values():
+            if len(indexes) > 1:
+                for index in indexes:
+                    to_remove |= 1 << index
+        self.possibles.intersect(~to_remove)
+
+
+# per process: cleaned up solvers shared by get_shared_solver, the least recently used first
+_SOLVERS: OrderedDict[Hashable, Solver] = OrderedDict()
+
+
+def get_shared_solver(key: Hashable, build: Callable[[], Solver]) -> Solver:
+    """ Return the cleaned up solver of key shared by the process, built by build if it isn't one of the last MAX_GAMES used """
+    solver = _SOLVERS.get(key)
+    if solver is None:
+        solver = build()
+        _SOLVERS[key] = solver
+        if len(_SOLVERS) > MAX_GAMES:
+            _SOLVERS.popitem(last=False)
+    _SOLVERS.move_to_end(key)
+    return solver
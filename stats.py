@@ -0,0 +1,83 @@
+""" Instrumentation of the solver hot paths """
+
+import json
+import time
+from typing import Any, Callable, Optional, TextIO
+
+from verificators import Verificator
+from utils import Combi
+
+
+class SolverStats:
+    """ Statistics of a solver: verificator calls, search sizes and candidates evolution
+
+    Verificators are instrumented by shadowing their methods on the instance,
+    and the solver only records anything when it holds a stats object, so
+    an uninstrumented solver runs the plain code.
+    """
+    methods = ("get_res", "make_try", "discard", "verify")
+
+    def __init__(self, trace: Optional[TextIO] = None) -> None:
+        self.calls: dict[str, int] = dict.fromkeys(self.methods, 0)
+        self.times: dict[str, float] = dict.fromkeys(self.methods, 0.0)
+        self.moves: list[dict[str, Any]] = []
+        self.trace = trace
+        self.current: dict[str, Any] = self.__new_move()
+
+    def __new_move(self) -> dict[str, Any]:
+        return {"searches": [], "verifications": []}
+
+    def __timed(self, name: str, method: Callable) -> Callable:
+        def timed_method(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.times[name] += time.perf_counter() - start
+                self.calls[name] += 1
+        return timed_method
+
+    def attach(self, verificator: Verificator) -> None:
+        """ Start recording the calls to the verificator """
+        for name in self.methods:
+            setattr(verificator, name, self.__timed(name, getattr(verificator, name)))
+
+    def detach(self, verificator: Verificator) -> None:
+        """ Stop recording the calls to the verificator """
+        for name in self.methods:
+            verificator.__dict__.pop(name, None)
+
+    def record_search(self, engine: str, subsets: int, tries: int, partitions: int, blocks: int, duration: float) -> None:
+        """ Record a move search: evaluated subsets and tries, computed partitions and their blocks """
+        self.current["searches"].append({
+            "engine": engine, "subsets": subsets, "tries": tries,
+            "partitions": partitions, "blocks": blocks, "time": duration,
+        })
+
+    def record_verification(self, slot: str, result: bool, before: int, after: int) -> None:
+        """ Record the number of candidates before and after a verification """
+        self.current["verifications"].append({"slot": slot, "result": result, "before": before, "after": after})
+
+    def end_move(self, combi: Combi, slots: list[str]) -> None:
+        """ Close the current move, and write it to the trace """
+        move = {"move": len(self.moves) + 1, "combi": str(combi), "verifs": slots, **self.current}
+        self.moves.append(move)
+        self.current = self.__new_move()
+        if self.trace is not None:
+            self.trace.write(json.dumps(move) + "\n")
+            self.trace.flush()
+
+    def to_dict(self) -> dict[str, Any]:
+        """ Return all the statistics """
+        return {"calls": self.calls, "times": self.times, "moves": self.moves}
+
+    def __str__(self) -> str:
+        output = "Verificator calls:"
+        for name in self.methods:
+            output += f"\n   - {name}: {self.calls[name]} calls, {self.times[name] * 1e3:.3f} ms"
+        for move in self.moves:
+            sizes = " -> ".join([str(verif["before"]) for verif in move["verifications"][:1]] +
+                                [str(verif["after"]) for verif in move["verifications"]])
+            searched = sum(search["subsets"] * search["tries"] for search in move["searches"])
+            output += f"\nMove {move['move']}: {move['combi']} {''.join(move['verifs'])}, {searched} (subset, try) evaluated, candidates {sizes}"
+        return output
@@ -0,0 +1,79 @@
+""" Move selection strategies, scoring a move from the candidate blocks it can lead to """
+
+import abc
+import math
+from typing import Any, Sequence
+
+
+class Strategy(abc.ABC):
+    """ Define how a (try, verificators) move is scored: the lowest score is played
+
+    A move splits the candidates into blocks, one per possible answer of the
+    verificators, and only the sizes of those blocks are used to score it.
+    Scores are rounded so that all engines see the same ties.
+    """
+    name: str
+
+    @abc.abstractmethod
+    def score(self, sizes: Sequence[int]) -> float:
+        """ Return the score of the move from the sizes of its blocks """
+
+    @abc.abstractmethod
+    def score_array(self, sizes: Any) -> Any:
+        """ Same as score, on a numpy array of sizes along the last axis (empty blocks are 0) """
+
+    def __repr__(self) -> str:
+        return self.name
+
+
+class MinMax(Strategy):
+    """ Minimize the worst case remaining candidates """
+    name = "minmax"
+
+    def score(self, sizes: Sequence[int]) -> float:
+        return max(sizes)
+
+    def score_array(self, sizes: Any) -> Any:
+        return sizes.max(axis=-1)
+
+
+class ExpectedSize(Strategy):
+    """ Minimize the expected remaining candidates, the solution being uniformly chosen
+
+    The expected size is sum(size ** 2) / total, and total is the same for every move.
+    """
+    name = "expected"
+
+    def score(self, sizes: Sequence[int]) -> float:
+        return sum(size * size for size in sizes)
+
+    def score_array(self, sizes: Any) -> Any:
+        return (sizes * sizes).sum(axis=-1)
+
+
+class Entropy(Strategy):
+    """ Maximize the information gained, the entropy of the blocks distribution
+
+    The entropy is log2(total) - sum(size * log2(size)) / total, so the move
+    minimizing sum(size * log2(size)) gains the most information.
+    """
+    name = "entropy"
+
+    def score(self, sizes: Sequence[int]) -> float:
+        return round(sum(size * math.log2(size) for size in sizes if size), 9)
+
+    def score_array(self, sizes: Any) -> Any:
+        # imported here as numpy is only needed by the numpy engine
+        import numpy as np
+
+        return np.round((sizes * np.log2(np.maximum(sizes, 1))).sum(axis=-1), 9)
+
+
+STRATEGIES: dict[str, Strategy] = {strategy.name: strategy for strategy in (MinMax(), ExpectedSize(), Entropy())}
+
+
+def get_strategy(name: str) -> Strategy:
+    """ Return the strategy of given name """
+    if name not in STRATEGIES:
+        raise ValueError(f"Strategy {name} is not valid")
+    return STRATEGIES[name]
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+
+""" Complete strategy trees: the solver's moves for every answer, computed ahead of time
+
+For a game without unknown criteria, the solver's move only depends on the
+candidates left, so its whole play can be expanded once: move -> answers of
+the verificators -> next move, down to a single candidate. Playing is then a
+lookup of the candidates in the tree.
+
+A tree is written as JSON:
+    {"version": 1, "game": {...}, "strategy": "minmax", "candidates": "<hex bitset>",
+     "moves": [[try_index, ["A", "C"]], ...],
+     "nodes": [[move, answers, child, answers, child, ...], ..., combinaison_index, ...]}
+the root being the first node and the candidates those left by the cleanup.
+A node is either a list, a move (index in moves) followed by the children of
+each possible answers (a bit per verificator, set when it answered True),
+or the index of the only combinaison left.
+"""
+
+import argparse
+import itertools
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Optional, TextIO, Tuple, Union
+
+from verificators import Verificator, MultiCriterion
+from candidates import popcount
+from game import Game
+from search import Progress
+from solver import Solver, get_shared_solver, MAX_ROUNDS
+from utils import Combi
+
+VERSION = 1
+CHUNK_SIZE = 16
+
+# a move: try index and verificator slots
+Move = tuple[int, tuple[str, ...]]
+# a node: move and (answers, child) pairs, or the index of the last combinaison
+Node = Union[tuple[int, tuple[tuple[int, int], ...]], int]
+
+
+def get_solver(spec: dict, strategy: str) -> Solver:
+    """ Return the cleaned up solver of the game definition for strategy, shared by the process """
+    game = Game.from_spec(spec)
+
+    def build() -> Solver:
+        solver = Solver(game, strategy=strategy)
+        solver.cleanup_combinaisons()
+        return solver
+
+    return get_shared_solver(("tree", game.get_signature(), strategy), build)
+
+
+def split(verifs: list[Verificator], candidates: int, try_index: int) -> dict[int, int]:
+    """ Return the candidates left after each possible answers of verifs for try_index """
+    children = {0: candidates}
+    for position, verif in enumerate(verifs):
+        false_mask, true_mask = verif.get_masks()[verif.get_table()[try_index]]
+        answers: dict[int, int] = {}
+        for answer, bits in children.items():
+            if bits & true_mask:
+                answers[answer | 1 << position] = bits & true_mask
+            if bits & false_mask:
+                answers[answer] = bits & false_mask
+        children = answers
+    return children
+
+
+def expand_states(spec: dict, strategy: str, states: list[int]) -> list[tuple[Move, dict[int, int]]]:
+    """ Return the solver's move for each candidates bitset, and the candidates after each answers, run in a worker """
+    solver = get_solver(spec, strategy)
+    expanded = []
+    for bits in states:
+        # the shared solver is left in its cleaned up state
+        solver.push()
+        solver.possibles.bits = bits
+        try:
+            combi, verifs = solver.find_move()
+        finally:
+            solver.pop()
+        slots = tuple(verif.get_slot() for verif in verifs)
+        children = split(list(verifs), bits, combi.index)
+        if popcount(bits) > 1 and bits in children.values():
+            raise ValueError(f"The move {combi} {list(slots)} doesn't split {popcount(bits)} candidates")
+        expanded.append(((combi.index, slots), children))
+    return expanded
+
+
+class StrategyTree:
+    """ The moves of a solver for every reachable candidates, from the state left by the cleanup
+
+    Nodes are keyed by their candidates bitset, so a state reached twice is
+    expanded once, and moves are stored once however many nodes play them.
+    """
+    build_time = 0.0
+
+    def __init__(self, game: Game, strategy: str, candidates: int, moves: list[Move], nodes: list[Node]) -> None:
+        self.game = game
+        self.strategy = strategy
+        self.candidates = candidates
+        self.moves = moves
+        self.nodes = nodes
+        # candidates -> node, of the nodes with a move
+        self.positions: dict[int, int] = {}
+        self.__index()
+
+    @classmethod
+    def build(cls, game: Game, strategy: str = "minmax", workers: int = 1) -> "StrategyTree":
+        """ Expand the solver's moves over every answer, level by level, the states of a level searched by workers """
+        if any(isinstance(verif, MultiCriterion) for verif in game.get_verificators()):
+            raise ValueError("Games with unknown criteria have no strategy tree")
+        start = time.perf_counter()
+        spec = game.get_spec()
+        root = get_solver(spec, strategy).possibles.get_bits()
+        if not root:
+            raise ValueError("No combinaison is left by the cleanup")
+        moves: list[Move] = []
+        move_ids: dict[Move, int] = {}
+        nodes: list[Optional[Node]] = [None]
+        # candidates -> node, of the nodes with a move and of the leaves
+        states: dict[int, int] = {root: 0}
+        leaves: dict[int, int] = {}
+        frontier = [root]
+
+        executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        try:
+            for _ in range(MAX_ROUNDS):
+                if not frontier:
+                    break
+                chunks = [frontier[index:index + CHUNK_SIZE] for index in range(0, len(frontier), CHUNK_SIZE)]
+                if executor is not None:
+                    results = executor.map(expand_states, itertools.repeat(spec), itertools.repeat(strategy), chunks)
+                else:
+                    results = (expand_states(spec, strategy, chunk) for chunk in chunks)
+                next_frontier = []
+                for bits, (move, children) in zip(frontier, itertools.chain.from_iterable(results)):
+                    if move not in move_ids:
+                        move_ids[move] = len(moves)
+                        moves.append(move)
+                    edges = []
+                    for answers, child in sorted(children.items()):
+                        if popcount(child) == 1:
+                            table = leaves
+                        else:
+                            table = states
+                        if child not in table:
+                            table[child] = len(nodes)
+                            nodes.append(child.bit_length() - 1 if table is leaves else None)
+                            if table is states:
+                                next_frontier.append(child)
+                        edges.append((answers, table[child]))
+                    nodes[states[bits]] = (move_ids[move], tuple(edges))
+                frontier = next_frontier
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        if frontier:
+            raise ValueError(f"The solver doesn't finish in {MAX_ROUNDS} rounds")
+
+        tree = cls(game, strategy, root, moves, nodes)  # type: ignore[arg-type]
+        tree.build_time = time.perf_counter() - start
+        return tree
+
+    def __index(self) -> None:
+        """ Find the candidates of every node with a move, walking down from the root """
+        verifs = {slot: self.game.get_verificator(slot) for slot in self.game.get_slots()}
+        pending = [(0, self.candidates)]
+        while pending:
+            node_id, bits = pending.pop()
+            node = self.nodes[node_id]
+            if isinstance(node, int):
+                if bits != 1 << node:
+                    raise ValueError(f"Node {node_id} doesn't match the game")
+                continue
+            self.positions[bits] = node_id
+            try_index, slots = self.moves[node[0]]
+            children = split([verifs[slot] for slot in slots], bits, try_index)
+            for answers, child_id in node[1]:
+                if answers not in children:
+                    raise ValueError(f"Node {node_id} doesn't match the game")
+                pending.append((child_id, children[answers]))
+
+    def get_move(self, candidates: int) -> Optional[Tuple[Combi, tuple[Verificator, ...]]]:
+        """ Return the move for the candidates, None if they are not in the tree """
+        node_id = self.positions.get(candidates)
+        if node_id is None:
+            return None
+        try_index, slots = self.moves[self.nodes[node_id][0]]  # type: ignore[index]
+        return Combi.from_index(try_index, self.game.space), tuple(self.game.get_verificator(slot) for slot in slots)
+
+    def get_solver(self, **kwargs) -> "TreeSolver":
+        """ Return a solver of the game playing the tree, in the state left by cleanup_combinaisons """
+        solver = TreeSolver(self, **kwargs)
+        solver.cleanup_combinaisons()
+        return solver
+
+    def get_stats(self) -> dict[str, Any]:
+        """ Return the size of the tree, and the rounds and queries needed over the combinaisons left by the cleanup """
+        # node -> (max rounds, max queries, total rounds, leaves), children being after their parent
+        depths: list[tuple[int, int, int, int]] = [(0, 0, 0, 1)] * len(self.nodes)
+        for node_id in reversed(range(len(self.nodes))):
+            node = self.nodes[node_id]
+            if isinstance(node, int):
+                continue
+            queries = len(self.moves[node[0]][1])
+            children = [depths[child_id] for _, child_id in node[1]]
+            depths[node_id] = (
+                1 + max(child[0] for child in children),
+                queries + max(child[1] for child in children),
+                sum(child[2] + child[3] for child in children),
+                sum(child[3] for child in children),
+            )
+        rounds, queries, total_rounds, leaves = depths[0]
+        return {
+            "nodes": len(self.nodes), "moves": len(self.moves), "leaves": leaves,
+            "depth": rounds, "max_queries": queries, "average_rounds": total_rounds / max(leaves, 1),
+            "build_time": self.build_time,
+        }
+
+    def to_dict(self) -> dict[str, Any]:
+        """ Return the tree as a JSON compatible dict """
+        nodes = [node if isinstance(node, int) else [node[0], *itertools.chain.from_iterable(node[1])] for node in self.nodes]
+        return {
+            "version": VERSION, "game": self.game.get_spec(), "strategy": self.strategy, "candidates": format(self.candidates, "x"),
+            "moves": [[try_index, list(slots)] for try_index, slots in self.moves], "nodes": nodes,
+        }
+
+    @classmethod
+    def from_dict(cls, description: dict, game: Optional[Game] = None) -> "StrategyTree":
+        """ Load a tree, checking it was built for game if given """
+        if description.get("version") != VERSION:
+            raise ValueError(f"Strategy tree version {description.get('version')} instead of {VERSION}")
+        tree_game = Game.from_spec(description["game"])
+        if game is not None and game.get_signature() != tree_game.get_signature():
+            raise ValueError("The strategy tree was built for another game")
+        nodes: list[Node] = [
+            node if isinstance(node, int) else (node[0], tuple(zip(node[1::2], node[2::2]))) for node in description["nodes"]
+        ]
+        moves = [(try_index, tuple(slots)) for try_index, slots in description["moves"]]
+        return cls(game or tree_game, description["strategy"], int(description["candidates"], 16), moves, nodes)
+
+    def write(self, output: TextIO) -> None:
+        """ Write the tree as compact JSON """
+        json.dump(self.to_dict(), output, separators=(",", ":"))
+
+    @classmethod
+    def read(cls, input_file: TextIO, game: Optional[Game] = None) -> "StrategyTree":
+        """ Read a tree written by write """
+        return cls.from_dict(json.load(input_file), game)
+
+
+class TreeSolver(Solver):
+    """ Solver playing the moves of a strategy tree, searching only for candidates out of the tree """
+    def __init__(self, tree: StrategyTree, **kwargs) -> None:
+        super().__init__(tree.game, strategy=tree.strategy, **kwargs)
+        self.tree = tree
+
+    def find_move(self, strategy: Optional[str] = None, progress: Optional[Progress] = None) -> Tuple[Combi, tuple[Verificator, ...]]:
+        if strategy is None or strategy == self.tree.strategy:
+            move = self.tree.get_move(self.possibles.get_bits())
+            if move is not None:
+                if self.stats is not None:
+                    self.stats.record_search("tree", 0, 0, 0, 0, 0.0)
+                return move
+        return super().find_move(strategy, progress)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the complete strategy tree of a game")
+    parser.add_argument("input", help="JSON game definition, as read by batch.py")
+    parser.add_argument("output", help="JSON strategy tree")
+    parser.add_argument("-s", "--strategy", default="minmax", help="strategy of the solver")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="number of worker processes")
+    args = parser.parse_args()
+
+    with open(args.input, encoding="utf-8") as game_file:
+        main_tree = StrategyTree.build(Game.from_spec(json.load(game_file)), args.strategy, args.workers)
+    with open(args.output, "w", encoding="utf-8") as tree_file:
+        main_tree.write(tree_file)
+        size = tree_file.tell()
+    json.dump({**main_tree.get_stats(), "bytes": size}, sys.stdout, indent=2)
+    print()
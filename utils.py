@@ -1,6 +1,5 @@
 from enum import Enum
-import functools
-from typing import Literal, Callable
+from typing import Literal, Callable, Optional, Sequence
 CombiVal = Literal[1, 2, 3, 4, 5]
 Optionval = Literal[1, 2, 3, 4]
 
@@ -9,15 +8,17 @@ class Shape(Enum):
     TRIANGLE = "triangle"
     CARRE = "carre"
     ROND = "rond"
+    ETOILE = "etoile"
+    LOSANGE = "losange"
 
     @classmethod
-    def list_shapes(cls) -> list:
-        role_names = [member for _, member in cls.__members__.items()]
-        return role_names
+    def list_shapes(cls, space: Optional["CodeSpace"] = None) -> list:
+        """ Return the shapes of space in order, those of the default space if not given """
+        return list((space or DEFAULT_SPACE).shapes)
 
     @classmethod
-    def print_list(cls) -> str:
-        return f"Ordered shapes: ({', '.join([elem.value for elem in cls.list_shapes()])})"
+    def print_list(cls, space: Optional["CodeSpace"] = None) -> str:
+        return f"Ordered shapes: ({', '.join([elem.value for elem in cls.list_shapes(space)])})"
 
 class Verifs(Enum):
     """ Define game verificators """
@@ -28,60 +29,174 @@ class Verifs(Enum):
     E = "E"
     F = "F"
     
-@functools.total_ordering
+SHAPE_SYMBOLS = {Shape.TRIANGLE: "▲", Shape.CARRE: "■", Shape.ROND: "●", Shape.ETOILE: "★", Shape.LOSANGE: "◆"}
+
+class CodeSpace:
+    """ Define the set of possible combinations: the shapes and the values they take
+
+    Combinations are numbered from 0 to get_size() - 1, the first shape being
+    the most significant, so that indexes follow the sorting order.
+    """
+    def __init__(self, shapes: Sequence[Shape] = (Shape.TRIANGLE, Shape.CARRE, Shape.ROND), max_value: int = 5) -> None:
+        if len(shapes) == 0 or len(set(shapes)) != len(shapes):
+            raise ValueError(f"Shapes {shapes} are not valid")
+        if max_value < 1:
+            raise ValueError(f"Maximum value {max_value} is not valid")
+        self.shapes: tuple[Shape, ...] = tuple(shapes)
+        self.max_value = max_value
+        self.positions = {shape: position for position, shape in enumerate(self.shapes)}
+
+    def get_size(self) -> int:
+        """ Return the number of combinations """
+        return self.max_value ** len(self.shapes)
+
+    def get_full_mask(self) -> int:
+        """ Return the bitset of all combinations """
+        return (1 << self.get_size()) - 1
+
+    def encode(self, values: Sequence[int]) -> int:
+        """ Return the index of the combination with given values """
+        if len(values) != len(self.shapes) or any(not 1 <= value <= self.max_value for value in values):
+            raise ValueError(f"Combination {tuple(values)} is not valid")
+        index = 0
+        for value in values:
+            index = index * self.max_value + value - 1
+        return index
+
+    def decode(self, index: int) -> tuple[int, ...]:
+        """ Return the values of the combination of given index """
+        values = []
+        for _ in self.shapes:
+            index, value = divmod(index, self.max_value)
+            values.append(value + 1)
+        return tuple(reversed(values))
+
+    def get_spec(self) -> dict:
+        """ Return the description of the code space """
+        return {"shapes": [shape.value for shape in self.shapes], "max_value": self.max_value}
+
+    @classmethod
+    def from_spec(cls, spec: dict) -> "CodeSpace":
+        """ Build a code space from its description """
+        return cls([Shape(shape) for shape in spec["shapes"]], spec["max_value"])
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, CodeSpace) and self.shapes == other.shapes and self.max_value == other.max_value
+
+    def __hash__(self) -> int:
+        return hash((self.shapes, self.max_value))
+
+    def __repr__(self) -> str:
+        return f"CodeSpace({', '.join(shape.value for shape in self.shapes)}; 1-{self.max_value})"
+
+DEFAULT_SPACE = CodeSpace()
+
 class Combi:
-    """ Define in-game combination """
-    triangle: CombiVal
-    carre: CombiVal
-    rond: CombiVal
-
-    def __init__(self, triangle: CombiVal, carre: CombiVal, rond: CombiVal) -> None:
-        assert carre in [1, 2, 3, 4, 5]
-        assert rond in [1, 2, 3, 4, 5]
-        assert triangle in [1, 2, 3, 4, 5]
-        self.triangle = triangle
-        self.carre = carre
-        self.rond = rond
+    """ Define in-game combination
+
+    A combination is identified by its code space and its index, which
+    follows the sorting order. The combinations of the default space are
+    interned: there is a single instance for each of them. Other spaces
+    build their combinations on demand.
+    """
+    __slots__ = ("index", "values", "space")
+    index: int
+    values: tuple[int, ...]
+    space: CodeSpace
+
+    _instances: list = []
+
+    def __new__(cls, triangle: CombiVal, carre: CombiVal, rond: CombiVal) -> "Combi":
+        return cls._instances[DEFAULT_SPACE.encode((triangle, carre, rond))]
+
+    @classmethod
+    def _build(cls, index: int, space: CodeSpace) -> "Combi":
+        combi = object.__new__(cls)
+        combi.index = index
+        combi.values = space.decode(index)
+        combi.space = space
+        return combi
+
+    @classmethod
+    def from_index(cls, index: int, space: CodeSpace = DEFAULT_SPACE) -> "Combi":
+        """ Return the combination of given index """
+        if not 0 <= index < space.get_size():
+            raise ValueError(f"Index {index} is not valid for {space}")
+        if space is DEFAULT_SPACE or space == DEFAULT_SPACE:
+            return cls._instances[index]
+        return cls._build(index, space)
+
+    @classmethod
+    def from_values(cls, values: Sequence[int], space: CodeSpace = DEFAULT_SPACE) -> "Combi":
+        """ Return the combination with given values, in the order of the space shapes """
+        return cls.from_index(space.encode(values), space)
+
+    @classmethod
+    def list_all(cls, space: CodeSpace = DEFAULT_SPACE) -> list:
+        """ Return all the combinations, ordered by index """
+        if space == DEFAULT_SPACE:
+            return list(cls._instances)
+        return [cls._build(index, space) for index in range(space.get_size())]
+
+    def get_index(self) -> int:
+        """ Return the index of the combination, following the sorting order """
+        return self.index
 
     def verify(self, function: Callable) -> bool:
         return function(self)
 
-    def get_shape(self, shape: Shape) -> CombiVal:
-        if shape == Shape.CARRE:
-            return self.carre
-        elif shape == Shape.ROND:
-            return self.rond
-        elif shape == Shape.TRIANGLE:
-            return self.triangle
-        raise ValueError(f"Shape {shape} is not valid")
+    def get_shape(self, shape: Shape) -> int:
+        position = self.space.positions.get(shape)
+        if position is None:
+            raise ValueError(f"Shape {shape} is not valid")
+        return self.values[position]
+
+    @property
+    def triangle(self) -> int:
+        return self.get_shape(Shape.TRIANGLE)
+
+    @property
+    def carre(self) -> int:
+        return self.get_shape(Shape.CARRE)
 
-    def count(self, value: CombiVal) -> int:
-        return sum(1 for v in [self.carre, self.rond, self.triangle] if v == value)
+    @property
+    def rond(self) -> int:
+        return self.get_shape(Shape.ROND)
+
+    def count(self, value: int) -> int:
+        return self.values.count(value)
 
     def __str__(self) -> str:
-        return f"(▲ {self.triangle}, ■ {self.carre}, ● {self.rond})"
+        return f"({', '.join(f'{SHAPE_SYMBOLS[shape]} {value}' for shape, value in zip(self.space.shapes, self.values))})"
+
+    def __lt__(self, other):
+        assert isinstance(other, Combi)
+        return self.index < other.index
+
+    def __le__(self, other):
+        assert isinstance(other, Combi)
+        return self.index <= other.index
 
     def __gt__(self, other):
         assert isinstance(other, Combi)
-        if self.triangle > other.triangle:
-            return True
-        if self.triangle < other.triangle:
-            return False
-        if self.carre > other.carre:
-            return True
-        if self.carre < other.carre:
-            return False
-        if self.rond > other.rond:
-            return True
-        return False
+        return self.index > other.index
+
+    def __ge__(self, other):
+        assert isinstance(other, Combi)
+        return self.index >= other.index
 
     def __eq__(self, other):
         assert isinstance(other, Combi)
-        return self.carre == other.carre and self.rond == other.rond and self.triangle == other.triangle
+        return self.index == other.index and (self.space is other.space or self.space == other.space)
 
     def __hash__(self):
-        return hash((self.carre, self.rond, self.triangle))
+        return self.index
+
+    def __reduce__(self):
+        return (Combi.from_index, (self.index, self.space))
 
     def __iter__(self):
-        for shape in Shape.list_shapes():
-            yield {shape: self.get_shape(shape)}
+        for shape, value in zip(self.space.shapes, self.values):
+            yield {shape: value}
+
+Combi._instances.extend(Combi._build(combi_index, DEFAULT_SPACE) for combi_index in range(DEFAULT_SPACE.get_size()))
@@ -1,289 +1,324 @@
 import abc
-from typing import Set, Optional, Union
-from utils import Combi, Shape, CombiVal
+import itertools
+from typing import Optional, Sequence, Union
+from utils import Combi, Shape, CombiVal, CodeSpace, DEFAULT_SPACE
+from candidates import CandidateSet
+from criteria import Expression
+
+NO_RESULT = -1
 
 class Verificator(abc.ABC):
     """ Define a verificator """
     solved: bool = False
     results: list[Union[str, int, Shape]]
     slot: str
+    space: CodeSpace = DEFAULT_SPACE
+    _table: Optional[tuple[int, ...]] = None
+    _masks: Optional[tuple[tuple[int, int], ...]] = None
 
     @abc.abstractmethod
-    def verify(self, solution: Combi, combinaison: Combi) -> bool:
-        pass
-
-    @abc.abstractmethod
-    def discard(self, possibles: Set[Combi], combinaison: Combi, result: bool) -> None:
-        pass
-
-    @abc.abstractmethod
-    def make_try(self, possibles: Set[Combi], result, is_true: bool) -> None:
-        pass
+    def _calc_res(self, combinaison: Combi) -> Optional[Union[str, int, Shape]]:
+        """ Compute the result for combinaison (only used to compile the table) """
 
     @abc.abstractmethod
     def __repr__(self) -> str:
         pass
 
-    @abc.abstractmethod
+    def get_table(self) -> tuple[int, ...]:
+        """ Return the result code of every combinaison, indexed by combinaison index
+
+        A result code is the index of the result in get_results(), or NO_RESULT
+        if the verificator gives no result for the combinaison.
+        """
+        if self._table is None:
+            codes = {result: code for code, result in enumerate(self.results)}
+            codes[None] = NO_RESULT
+            self._table = tuple(codes[self._calc_res(Combi.from_index(index, self.space))] for index in range(self.space.get_size()))
+        return self._table
+
+    def set_compiled(self, table: Sequence[int], masks: tuple[tuple[int, int], ...]) -> None:
+        """ Use an already compiled table and its masks, e.g. from a compiled game file """
+        self._table = table  # type: ignore[assignment]
+        self._masks = masks
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        if isinstance(state.get("_table"), memoryview):
+            # memory-mapped tables can't be pickled
+            state["_table"] = tuple(state["_table"])
+        return state
+
+    def get_code(self, combinaison: Combi) -> int:
+        """ Return the result code for combinaison """
+        return self.get_table()[combinaison.index]
+
+    def get_masks(self) -> tuple[tuple[int, int], ...]:
+        """ Return, for each result code, the bitsets of combinaisons that do not have / have it
+
+        NO_RESULT masks are stored last, so that they are indexed by NO_RESULT.
+        """
+        if self._masks is None:
+            table = self.get_table()
+            masks = []
+            full_mask = self.space.get_full_mask()
+            for mask_code in list(range(len(self.results))) + [NO_RESULT]:
+                # bit strings are written most significant (last index) first
+                mask = int("".join("1" if table_code == mask_code else "0" for table_code in reversed(table)), 2)
+                masks.append((full_mask & ~mask, mask))
+            self._masks = tuple(masks)
+        return self._masks
+
+    def get_code_mask(self, code: int, is_true: bool) -> int:
+        """ Return the bitset of combinaisons whose result code is (is_true) or is not code """
+        return self.get_masks()[code][is_true]
+
+    def get_mask(self, result: Optional[Union[str, int, Shape]], is_true: bool) -> int:
+        """ Return the bitset of combinaisons whose result is (is_true) or is not result """
+        return self.get_code_mask(NO_RESULT if result is None else self.results.index(result), is_true)
+
     def get_res(self, combinaison: Combi) -> Optional[Union[str, int, Shape]]:
-        pass
+        """ Return the result for combinaison """
+        code = self.get_code(combinaison)
+        if code == NO_RESULT:
+            return None
+        return self.results[code]
+
+    def verify(self, solution: Combi, combinaison: Combi) -> bool:
+        """ Check if combinaison gives the same result as the solution """
+        solution_code = self.get_code(solution)
+        assert solution_code != NO_RESULT
+        res = solution_code == self.get_code(combinaison)
+        self.solved = self.solved or res
+        return res
+
+    def discard(self, possibles: CandidateSet, combinaison: Combi, result: bool) -> None:
+        """ Discard all combinaison that don't match the result """
+        possibles.intersect(self.get_code_mask(self.get_code(combinaison), result))
+
+    def make_try(self, possibles: CandidateSet, result, is_true: bool) -> None:
+        """ Make a try to find the solution """
+        assert result in self.results
+        possibles.intersect(self.get_mask(result, is_true))
+
+    def get_params(self) -> dict[str, Union[str, int]]:
+        """ Return the parameters of the verificator """
+        return {}
+
+    def get_spec(self) -> dict[str, Union[str, int]]:
+        """ Return the canonical description of the verificator """
+        return {"type": type(self).__name__, **self.get_params()}
 
     def get_results(self) -> list[Union[str, int, Shape]]:
         """ Return the list of results """
         return self.results
 
+    def set_space(self, space: CodeSpace) -> None:
+        """ Set the code space of the combinaisons to verify """
+        if space != self.space:
+            self.space = space
+            self._table = None
+            self._masks = None
+
     def set_slot(self, slot_name: str):
         """ Set the slot name """
         self.slot = slot_name
-    
+
     def get_slot(self) -> str:
         """ Return the slot name """
         return self.slot
 
-class Compare(Verificator):
+class Criterion(Verificator):
+    """ Define a verificator from an expression over the shapes (see criteria.py)
+
+    The expression is compiled once per code space, and only used to build the table.
+    """
+    def __init__(self, expression: str, description: Optional[str] = None) -> None:
+        self.expression = Expression(expression)
+        self.description = description
+
+    @property
+    def results(self) -> list[Union[str, int, Shape]]:  # type: ignore[override]
+        return self.expression.compile(self.space)[1]
+
+    def _calc_res(self, combinaison: Combi) -> Optional[Union[str, int, Shape]]:
+        return self.expression.compile(self.space)[0](combinaison.values)
+
+    def get_table(self) -> tuple[int, ...]:
+        if self._table is None:
+            # evaluated on the values, so that no combinaison is built
+            function, results = self.expression.compile(self.space)
+            codes = {result: code for code, result in enumerate(results)}
+            codes[None] = NO_RESULT
+            self._table = tuple(codes[function(self.space.decode(index))] for index in range(self.space.get_size()))
+        return self._table
+
+    def get_params(self) -> dict[str, Union[str, int]]:
+        params: dict[str, Union[str, int]] = {"expression": self.expression.source}
+        if self.description is not None:
+            params["description"] = self.description
+        return params
+
+    def __repr__(self) -> str:
+        return self.description or f"Verifying {self.expression}"
+
+class Compare(Criterion):
     """ Define a verificator that compare a shape's value to a given value """
     def __init__(self, shape: Shape, value: CombiVal) -> None:
+        super().__init__(f"compare({shape.value}, {value})")
         self.shape: Shape = shape
         self.value: CombiVal = value
-        self.results = ["<", "=", ">"]
 
-    def __comp(self, combinaison: Combi) -> str:
-        if combinaison.get_shape(self.shape) > self.value:
-            return ">"
-        if combinaison.get_shape(self.shape) < self.value:
-            return "<"
-        return "="
-
-    def verify(self, solution: Combi, combinaison: Combi) -> bool:
-        res = self.__comp(solution) == self.__comp(combinaison)
-        self.solved = self.solved or res
-        return res
-
-    def discard(self, possibles: Set[Combi], combinaison: Combi, result: bool) -> None:
-        """ Discard all combinaison that don't match the result """
-        comp = self.__comp(combinaison)
-        to_remove = set()
-        for possible in possibles:
-            if self.__comp(possible) == comp:
-                if not result:
-                    to_remove.add(possible)
-            else:
-                if result:
-                    to_remove.add(possible)
-        possibles.difference_update(to_remove)
-
-    def make_try(self, possibles: Set[Combi], result: str, is_true: bool) -> None:
-        """ Make a try to find the solution """
-        assert result in self.results
-        to_discard = set()
-        for possible in possibles:
-            if (self.__comp(possible) != result) is is_true:
-                to_discard.add(possible)
-        possibles.difference_update(to_discard)
-
-    def get_res(self, combinaison: Combi) -> Union[str, int, Shape]:
-        """ Return the result for combinaison """
-        return self.__comp(combinaison)
+    def get_params(self) -> dict[str, Union[str, int]]:
+        return {"shape": self.shape.value, "value": self.value}
 
     def __repr__(self) -> str:
         return f"Verifying value of shape {self.shape.value} compared to {self.value}"
 
-class OccurenceVal(Verificator):
+class OccurenceVal(Criterion):
     """ Define a verificator that check the number of occurence of a value """
     def __init__(self, value: CombiVal) -> None:
+        super().__init__(f"count({value})")
         self.value: CombiVal = value
-        self.results = [0, 1, 2, 3]
-
-    def __calc_occurence(self, combinaison: Combi) -> int:
-        """ Calculate the maximum occurence """
-        return sum(1 for shape in Shape.list_shapes() if combinaison.get_shape(shape) == self.value)
-
-    def verify(self, solution: Combi, combinaison: Combi) -> bool:
-        res = self.__calc_occurence(solution) == \
-                self.__calc_occurence(combinaison)
-        self.solved = self.solved or res
-        return res
-
-    def discard(self, possibles: Set[Combi], combinaison: Combi, result: bool) -> None:
-        """ Discard all combinaison that don't match the result """
-        nb_occ = self.__calc_occurence(combinaison)
-        to_remove = set()
-        for possible in possibles:
-            if possible.count(self.value) == nb_occ:
-                if not result:
-                    to_remove.add(possible)
-            else:
-                if result:
-                    to_remove.add(possible)
-        possibles.difference_update(to_remove)
-
-    def make_try(self, possibles: Set[Combi], result: int, is_true: bool) -> None:
-        """ Make a try to find the solution """
-        assert result in self.results
-        to_discard = set()
-        for possible in possibles:
-            if (self.__calc_occurence(possible) != result) is is_true:
-                to_discard.add(possible)
-        possibles.difference_update(to_discard)
-
 
-    def get_res(self, combinaison: Combi) -> Union[str, int, Shape]:
-        """ Return the result for combinaison """
-        return self.__calc_occurence(combinaison)
+    def get_params(self) -> dict[str, Union[str, int]]:
+        return {"value": self.value}
 
     def __repr__(self) -> str:
         return f"Verifying occurence for number {self.value}"
 
-class OccurenceAll(Verificator):
+class OccurenceAll(Criterion):
     """ Define a verificator that checks if maximum occurence is 1, 2 or 3 """
     def __init__(self):
-        self.results = [1, 2, 3]
-
-    def __calc_occurence(self, combinaison: Combi) -> int:
-        """ Calculate the maximum occurence """
-        return max(sum(1 for shape in Shape.list_shapes() if combinaison.get_shape(shape) == value) for value in range(1, 6))
-
-    def verify(self, solution: Combi, combinaison: Combi) -> bool:
-        res = self.__calc_occurence(solution) == self.__calc_occurence(combinaison)
-        self.solved = self.solved or res
-        return res
-
-    def discard(self, possibles: Set[Combi], combinaison: Combi, result: bool) -> None:
-        """ Discard all combinaison that don't match the result """
-        nb_occ = self.__calc_occurence(combinaison)
-        to_remove = set()
-        for possible in possibles:
-            if any(possible.count(element) == nb_occ for element in range(1, 6)):
-                if not result:
-                    to_remove.add(possible)
-            else:
-                if result:
-                    to_remove.add(possible)
-        possibles.difference_update(to_remove)
-
-    def make_try(self, possibles: Set[Combi], result: int, is_true: bool) -> None:
-        """ Make a try to find the solution """
-        assert result in self.results
-        to_discard = set()
-        for possible in possibles:
-            if (self.__calc_occurence(possible) != result) is is_true:
-                to_discard.add(possible)
-
-        possibles.difference_update(to_discard)
+        super().__init__("max_count()")
 
-    def get_res(self, combinaison: Combi) -> Union[str, int, Shape]:
-        """ Return the result for combinaison """
-        return self.__calc_occurence(combinaison)
+    def get_params(self) -> dict[str, Union[str, int]]:
+        return {}
 
     def __repr__(self) -> str:
         return "Verifying number of identical numbers"
 
 
-class Smallest(Verificator):
+class Smallest(Criterion):
     """ Define a verificator that checks which shape is smallest """
     def __init__(self):
-        self.results = [Shape.CARRE, Shape.ROND, Shape.TRIANGLE]
-
-    def __calc_smallest(self, combinaison: Combi) -> Optional[Shape]:
-        """ Calculate the maximum occurence """
-        min_val = 6
-        min_shape = None
-        crit_flag = False
-        for elem in combinaison:
-            for key, value in elem.items():
-                if value < min_val:
-                    min_val = value
-                    crit_flag = False
-                    min_shape = key
-                elif value == min_val:
-                    crit_flag = True
-        if crit_flag:
-            return None
-        return min_shape
-
-    def verify(self, solution: Combi, combinaison: Combi) -> bool:
-        assert self.__calc_smallest(solution) is not None
-        res = self.__calc_smallest(solution) == self.__calc_smallest(combinaison)
-        self.solved = self.solved or res
-        return res
-
-    def discard(self, possibles: Set[Combi], combinaison: Combi, result: bool) -> None:
-        """ Discard all combinaison that don't match the result """
-        min_shape = self.__calc_smallest(combinaison)
-        to_remove = set()
-        for possible in possibles:
-            if self.__calc_smallest(possible) == min_shape:
-                if not result:
-                    to_remove.add(possible)
-            else:
-                if result:
-                    to_remove.add(possible)
-        possibles.difference_update(to_remove)
-
-    def make_try(self, possibles: Set[Combi], result: Shape, is_true: bool) -> None:
-        """ Make a try to find the solution """
-        assert result in self.results
-        to_discard = set()
-        for possible in possibles:
-            if (self.__calc_smallest(possible) != result) is is_true:
-                to_discard.add(possible)
+        super().__init__("smallest()")
 
-        possibles.difference_update(to_discard)
-
-    def get_res(self, combinaison: Combi) -> Optional[Union[str, int, Shape]]:
-        """ Return the result for combinaison """
-        return self.__calc_smallest(combinaison)
+    def get_params(self) -> dict[str, Union[str, int]]:
+        return {}
 
     def __repr__(self) -> str:
         return "Verifying which shape is smallest"
 
 
-class Compare2(Verificator):
+class Compare2(Criterion):
     """ Define a verificator that checks comparison between two shapes """
     def __init__(self, shape1: Shape, shape2: Shape) -> None:
+        super().__init__(f"compare({shape1.value}, {shape2.value})")
         self.shape1: Shape = shape1
         self.shape2: Shape = shape2
-        self.results = ["<", "=", ">"]
 
-    def __comp2(self, combinaison: Combi) -> str:
-        """ Calculate the maximum occurence """
-        if combinaison.get_shape(self.shape1) > combinaison.get_shape(self.shape2):
-            return ">"
-        if combinaison.get_shape(self.shape1) < combinaison.get_shape(self.shape2):
-            return "<"
-        return "="
+    def get_params(self) -> dict[str, Union[str, int]]:
+        return {"shape1": self.shape1.value, "shape2": self.shape2.value}
 
-    def verify(self, solution: Combi, combinaison: Combi) -> bool:
-        res = self.__comp2(solution) == self.__comp2(combinaison)
-        self.solved = self.solved or res
-        return res
+    def __repr__(self) -> str:
+        return f"Comparing value between {self.shape1.value} and {self.shape2.value}"
 
-    def discard(self, possibles: Set[Combi], combinaison: Combi, result: bool) -> None:
-        """ Discard all combinaison that don't match the result """
-        comp = self.__comp2(combinaison)
-        to_remove = set()
-        for possible in possibles:
-            if self.__comp2(possible) == comp:
-                if not result:
-                    to_remove.add(possible)
-            else:
-                if result:
-                    to_remove.add(possible)
-        possibles.difference_update(to_remove)
-
-    def make_try(self, possibles: Set[Combi], result: str, is_true: bool) -> None:
-        """ Make a try to find the solution """
-        assert result in self.results
-        to_discard = set()
-        for possible in possibles:
-            if (self.__comp2(possible) != result) is is_true:
-                to_discard.add(possible)
 
-        possibles.difference_update(to_discard)
+class MultiCriterion(Verificator):
+    """ Define a verificator card holding several criteria, only one of them being active
 
-    def get_res(self, combinaison: Combi) -> Union[str, int, Shape]:
-        """ Return the result for combinaison """
-        return self.__comp2(combinaison)
+    The active criterion answers the verifications. The solver doesn't know
+    it: it tracks every possible (combinaison, criteria) world instead.
+    """
+    def __init__(self, criteria: list[Verificator], active: Optional[int] = None) -> None:
+        assert len(criteria) > 0
+        assert active is None or 0 <= active < len(criteria)
+        self.criteria = criteria
+        self.active = active
+
+    @property
+    def results(self) -> list[Union[str, int, Shape]]:  # type: ignore[override]
+        return self.criteria[self.active].get_results() if self.active is not None else []
+
+    def get_active(self) -> Verificator:
+        """ Return the active criterion """
+        if self.active is None:
+            raise ValueError("The active criterion is not known")
+        return self.criteria[self.active]
+
+    def set_active(self, active: int) -> None:
+        """ Set the active criterion """
+        assert 0 <= active < len(self.criteria)
+        self.active = active
+
+    def _calc_res(self, combinaison: Combi) -> Optional[Union[str, int, Shape]]:
+        return self.get_active().get_res(combinaison)
+
+    def get_table(self) -> tuple[int, ...]:
+        return self.get_active().get_table()
+
+    def get_masks(self) -> tuple[tuple[int, int], ...]:
+        return self.get_active().get_masks()
+
+    def set_space(self, space: CodeSpace) -> None:
+        super().set_space(space)
+        for criterion in self.criteria:
+            criterion.set_space(space)
+
+    def set_slot(self, slot_name: str):
+        super().set_slot(slot_name)
+        for criterion in self.criteria:
+            criterion.set_slot(slot_name)
+
+    def get_params(self) -> dict:
+        # the active criterion is hidden information, it is not part of the spec
+        return {"criteria": [criterion.get_spec() for criterion in self.criteria]}
 
     def __repr__(self) -> str:
-        return f"Comparing value between {self.shape1.value} and {self.shape2.value}"
+        return " or ".join(repr(criterion) for criterion in self.criteria)
+
+
+def card_library(space: CodeSpace = DEFAULT_SPACE) -> list[Verificator]:
+    """ Return every criterion of the card library for space """
+    shapes = space.shapes
+    values = range(1, space.max_value + 1)
+    cards: list[Verificator] = [Compare(shape, value) for shape in shapes for value in values]
+    cards += [Compare2(shape1, shape2) for shape1, shape2 in itertools.combinations(shapes, 2)]
+    cards += [OccurenceVal(value) for value in values]
+    cards += [OccurenceAll(), Smallest()]
+    cards += [
+        Criterion("largest()", "Verifying which shape is largest"),
+        Criterion("order()", "Verifying if values are in ascending or descending order"),
+        Criterion("even()", "Verifying the number of even values"),
+        Criterion("distinct()", "Verifying the number of different values"),
+        Criterion("parity(total())", "Verifying the parity of the sum of values"),
+    ]
+    cards += [Criterion(f"parity({shape.value})", f"Verifying the parity of shape {shape.value}") for shape in shapes]
+    cards += [Criterion(f"compare(total(), {total})", f"Verifying the sum of values compared to {total}")
+              for total in range(len(shapes) + 1, len(shapes) * space.max_value)]
+    cards += [Criterion(f"compare({shape1.value} + {shape2.value}, {space.max_value + 1})",
+                        f"Verifying the sum of shapes {shape1.value} and {shape2.value} compared to {space.max_value + 1}")
+              for shape1, shape2 in itertools.combinations(shapes, 2)]
+    for card in cards:
+        card.set_space(space)
+    return cards
+
+
+def verificator_from_spec(spec: dict) -> Verificator:
+    """ Build a verificator from its description (see Verificator.get_spec) """
+    params = {key: value for key, value in spec.items() if key != "type"}
+    if spec.get("type") == "Compare":
+        return Compare(Shape(params["shape"]), params["value"])
+    if spec.get("type") == "OccurenceVal":
+        return OccurenceVal(params["value"])
+    if spec.get("type") == "OccurenceAll":
+        return OccurenceAll()
+    if spec.get("type") == "Smallest":
+        return Smallest()
+    if spec.get("type") == "Compare2":
+        return Compare2(Shape(params["shape1"]), Shape(params["shape2"]))
+    if spec.get("type") == "Criterion":
+        return Criterion(params["expression"], params.get("description"))
+    if spec.get("type") == "MultiCriterion":
+        return MultiCriterion([verificator_from_spec(criterion) for criterion in params["criteria"]], params.get("active"))
+    raise ValueError(f"Verificator type {spec.get('type')} is not valid")
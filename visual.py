@@ -1,10 +1,16 @@
 #!/usr/bin/env python3.9
 
+import queue
+import threading
 import tkinter as tk
+from tkinter import ttk
+from typing import Optional
 from verificators import Verificator
 from game import Game
+from history import GameHistory
+from search import SearchCancelled
 from solver import Solver
-from utils import Combi
+from utils import Combi, CodeSpace
 
 class VerificatorVisual(tk.Frame):
     """ visual representation of a verificator """
@@ -33,22 +39,64 @@ class GameVisual(tk.Frame):
         self.label.configure(bg=self['bg'], font=("Arial", 12, "bold"))
         self.label.grid(row=0, column=0, columnspan=2)
 
-        for index, verificator_dict in enumerate(game.list_verificators()):
-            for letter, verificator in verificator_dict.items():
-                letter_label = tk.Label(self, text=letter)
-                letter_label.configure(bg=self['bg'], font=("Arial", 14, "bold"))
-                letter_label.grid(row=index+1, column=0, padx=5, pady=5)
+        for index, (letter, verificator) in enumerate(game.get_slots().items()):
+            letter_label = tk.Label(self, text=letter)
+            letter_label.configure(bg=self['bg'], font=("Arial", 14, "bold"))
+            letter_label.grid(row=index+1, column=0, padx=5, pady=5)
 
-                verificator_label = VerificatorVisual(self, verificator)
-                verificator_label.grid(row=index+1, column=1, pady=10, sticky="ew")
+            verificator_label = VerificatorVisual(self, verificator)
+            verificator_label.grid(row=index+1, column=1, pady=10, sticky="ew")
 
         self.grid_columnconfigure(0, weight=1)
-        self.grid_rowconfigure(len(game.list_verificators())+1, weight=1)
+        self.grid_rowconfigure(len(game.get_slots())+1, weight=1)
+
+
+class VirtualList(tk.Frame):
+    """ Scrolling list of combinaisons only drawing the visible rows """
+    row_height = 20
+
+    def __init__(self, parent, space: CodeSpace, height: int = 300):
+        super().__init__(parent, bg=parent['bg'])
+        self.space = space
+        self.indexes: list[int] = []
+        self.canvas = tk.Canvas(self, bg=self['bg'], height=height, width=120, highlightthickness=0)
+        self.scrollbar = tk.Scrollbar(self, orient=tk.VERTICAL, command=self.scroll)
+        self.canvas.configure(yscrollcommand=self.scrollbar.set)
+        self.canvas.grid(row=0, column=0, sticky="nsew")
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+        self.canvas.bind("<Configure>", lambda _: self.draw())
+
+    def set_indexes(self, indexes: list[int]):
+        """ Shows the combinaisons of given indexes """
+        self.indexes = indexes
+        self.canvas.configure(scrollregion=(0, 0, 0, len(indexes) * self.row_height))
+        self.draw()
+
+    def scroll(self, *args):
+        """ Scrollbar command: moves the view then draws the rows now visible """
+        self.canvas.yview(*args)
+        self.draw()
+
+    def draw(self):
+        """ Draws the visible rows only """
+        self.canvas.delete("row")
+        top = int(self.canvas.canvasy(0))
+        first = max(top // self.row_height, 0)
+        last = min((top + self.canvas.winfo_height()) // self.row_height + 1, len(self.indexes))
+        for row in range(first, last):
+            combi = Combi.from_index(self.indexes[row], self.space)
+            self.canvas.create_text(5, row * self.row_height + self.row_height // 2, text=str(combi), anchor="w", tags="row")
 
 
 class ResultsVisual(tk.Frame):
-    """ Contains the results """
+    """ Contains the results
+
+    A label is kept per combinaison shown and only the labels of eliminated
+    combinaisons are destroyed. Above max_labels results, they are shown in
+    a VirtualList instead.
+    """
     max_rows = 15  # Maximum number of rows per column
+    max_labels = 150  # Maximum number of results shown as labels
 
     def __init__(self, parent, solver: Solver):
         super().__init__(parent, bg="white", borderwidth=1, relief=tk.SOLID, padx=10, pady=10)
@@ -58,26 +106,46 @@ class ResultsVisual(tk.Frame):
 
         self.solver = solver
 
-        self.results_labels = []
+        self.results_labels: dict[int, tk.Label] = {}
+        self.virtual_list: Optional[VirtualList] = None
         self.show_results()
 
     def show_results(self):
         """ Shows the results """
-        for label in self.results_labels:
+        # combinaisons are ordered by index
+        indexes = list(self.solver.possibles.indexes())
+        self.label.configure(text=f"Results ({len(indexes)})")
+        if len(indexes) > self.max_labels:
+            self.show_virtual_list(indexes)
+        else:
+            self.show_labels(indexes)
+
+    def show_labels(self, indexes: list[int]):
+        """ Shows the results as labels, only creating those of new results """
+        if self.virtual_list is not None:
+            self.virtual_list.grid_remove()
+
+        shown = set(indexes)
+        for index in [index for index in self.results_labels if index not in shown]:
+            self.results_labels.pop(index).destroy()
+
+        for position, index in enumerate(indexes):
+            label = self.results_labels.get(index)
+            if label is None:
+                label = tk.Label(self, text=str(Combi.from_index(index, self.solver.possibles.space)))
+                self.results_labels[index] = label
+            label.grid(row=position % self.max_rows + 1, column=position // self.max_rows, pady=3, padx=3)
+
+    def show_virtual_list(self, indexes: list[int]):
+        """ Shows the results in a virtual list """
+        for label in self.results_labels.values():
             label.destroy()
-        self.results_labels = []
-
-        current_col = 0
-        current_row = 1
-
-        list_possibles = list(self.solver.possibles)
-        list_possibles.sort()
+        self.results_labels = {}
 
-        for index, combi in enumerate(list_possibles):
-            label = tk.Label(self, text=str(combi))
-            label.grid(row=current_row, column=current_col, pady=3, padx=3)
-            self.results_labels.append(label)
-            current_row = ((index + 1) % self.max_rows) + 1
+        if self.virtual_list is None:
+            self.virtual_list = VirtualList(self, self.solver.possibles.space)
+        self.virtual_list.grid(row=1, column=0, columnspan=2, sticky="nsew")
+        self.virtual_list.set_indexes(indexes)
 
 class HistoryVisual(tk.Frame):
     """ Visual representation of the history played """
@@ -88,59 +156,192 @@ class HistoryVisual(tk.Frame):
         label.grid(row=0, column=0, columnspan=2)
 
         self.row_index = 1
+        # labels of each round, with the row index before it
+        self.rounds: list[tuple[int, list[tk.Label]]] = []
 
     def add_history(self, chosen_combi: Combi, chosen_verifs: list[tuple[Verificator, bool]]):
         """ Adds a history to the visual """
+        labels = []
+        start = self.row_index
         if self.row_index > 1:
             empty_label = tk.Label(self, text="")
             empty_label.grid(row=self.row_index, column=0, columnspan=2, pady=5)
+            labels.append(empty_label)
             self.row_index += 1
 
         label_combi = tk.Label(self, text=f"{chosen_combi} :")
         label_combi.grid(row=self.row_index, column=0, padx=5, pady=0)
+        labels.append(label_combi)
 
         for index, result in enumerate(chosen_verifs):
             label_verif = tk.Label(self, text=f"{result[0].get_slot()} - {result[1]}")
             label_verif.grid(row=self.row_index + index, column=1, padx=5, pady=0, sticky="w")
+            labels.append(label_verif)
 
         self.row_index += len(chosen_verifs)
+        self.rounds.append((start, labels))
+
+    def remove_history(self):
+        """ Removes the last history added """
+        self.row_index, labels = self.rounds.pop()
+        for label in labels:
+            label.destroy()
+
+class MoveSearch(threading.Thread):
+    """ Search the next move of the solver out of the tkinter main loop
+
+    The solver state is only read by the search; progress, the move found or
+    the cancellation are put in messages, polled by the main loop which
+    plays the move.
+    """
+    def __init__(self, solver: Solver):
+        super().__init__(daemon=True)
+        self.solver = solver
+        self.messages: queue.Queue = queue.Queue()
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        """ Stop the search at the next progress report """
+        self.cancelled.set()
+
+    def report(self, done: int, total: int):
+        """ Progress callback of the search """
+        if self.cancelled.is_set():
+            raise SearchCancelled()
+        self.messages.put(("progress", done, total))
+
+    def run(self):
+        try:
+            move = self.solver.find_move(progress=self.report)
+        except SearchCancelled:
+            self.messages.put(("cancelled",))
+        except Exception as error:  # pylint: disable=broad-except
+            # shown by the main loop, the thread would die silently otherwise
+            self.messages.put(("error", error))
+        else:
+            self.messages.put(("done", move))
 
 class SolverVisual(tk.Frame):
     """ Visual representation of the solver """
+    poll_delay = 50  # milliseconds between two checks of the search messages
+    search: Optional[MoveSearch] = None
+    history_written = False
 
-    def __init__(self, parent, solver: Solver, results_visual: ResultsVisual, history_visual: HistoryVisual):
+    def __init__(self, parent, solver: Solver, results_visual: ResultsVisual, history_visual: HistoryVisual, history_path: Optional[str] = None):
         super().__init__(parent, bg="lightgreen", borderwidth=1, relief=tk.SOLID, padx=10, pady=10)
         label = tk.Label(self, text="Solver")
         label.configure(bg=self['bg'], font=("Arial", 12, "bold"))
-        label.grid(row=0, column=0, columnspan=2)
+        label.grid(row=0, column=0, columnspan=3)
 
         self.solver = solver
         self.results_visual = results_visual
         self.history_visual = history_visual
+        self.history_path = history_path
 
         self.add_solving_button()
+        # the history is written once, with the rounds left when the window closes
+        self.bind("<Destroy>", lambda event: self.write_history())
 
     def add_solving_button(self):
-        """ Adds a button to solve the game """
-        def solve_try():
-            """ Solves a try """
-            if not self.solver.is_finished():
-                chosen_combi, results = self.solver.solve()
-                self.results_visual.show_results()
-                self.history_visual.add_history(chosen_combi, results)
-
-        best_try_button = tk.Button(self, text="Best Try", command=solve_try)
-        best_try_button.grid(row=1, column=0, pady=5)
+        """ Adds the buttons to solve the game, to cancel the search and to undo the last round, with its progress """
+        self.best_try_button = tk.Button(self, text="Best Try", command=self.start_search)
+        self.best_try_button.grid(row=1, column=0, pady=5)
+
+        self.cancel_button = tk.Button(self, text="Cancel", command=self.cancel_search, state=tk.DISABLED)
+        self.cancel_button.grid(row=1, column=1, pady=5)
+
+        self.undo_button = tk.Button(self, text="Undo", command=self.undo_round, state=tk.DISABLED)
+        self.undo_button.grid(row=1, column=2, pady=5)
+
+        self.progress_bar = ttk.Progressbar(self, mode="determinate", maximum=1)
+        self.progress_bar.grid(row=2, column=0, columnspan=3, pady=5, sticky="ew")
+
+        self.status_label = tk.Label(self, text="", bg=self['bg'])
+        self.status_label.grid(row=3, column=0, columnspan=3)
+
+    def start_search(self):
+        """ Starts searching the best try in the background """
+        if self.solver.is_finished() or self.search is not None:
+            return
+        self.search = MoveSearch(self.solver)
+        self.best_try_button.configure(state=tk.DISABLED)
+        self.cancel_button.configure(state=tk.NORMAL)
+        self.undo_button.configure(state=tk.DISABLED)
+        self.progress_bar.configure(value=0)
+        self.status_label.configure(text="Searching...")
+        self.search.start()
+        self.after(self.poll_delay, self.poll_search)
+
+    def cancel_search(self):
+        """ Cancels the running search """
+        if self.search is not None:
+            self.search.cancel()
+            self.status_label.configure(text="Cancelling...")
+
+    def undo_round(self):
+        """ Restores the state before the last round played """
+        if self.search is not None or not self.solver.get_depth():
+            return
+        self.solver.pop()
+        self.results_visual.show_results()
+        self.history_visual.remove_history()
+        self.progress_bar.configure(value=0)
+        self.status_label.configure(text="")
+        self.update_undo_button()
+
+    def update_undo_button(self):
+        """ Enables the undo button when a round was played """
+        self.undo_button.configure(state=tk.NORMAL if self.solver.get_depth() else tk.DISABLED)
+
+    def write_history(self):
+        """ Appends the history of the game to the history file, once """
+        if self.history_written or self.solver.history is None or not self.solver.history.rounds or self.history_path is None:
+            return
+        self.history_written = True
+        with open(self.history_path, "a", encoding="utf-8") as history_file:
+            self.solver.history.write(history_file)
+
+    def poll_search(self):
+        """ Handles the messages of the search, then polls again until it ended """
+        assert self.search is not None
+        while True:
+            try:
+                message = self.search.messages.get_nowait()
+            except queue.Empty:
+                self.after(self.poll_delay, self.poll_search)
+                return
+            if message[0] == "progress":
+                self.progress_bar.configure(maximum=message[2], value=message[1])
+                continue
+            break
+
+        self.search = None
+        self.best_try_button.configure(state=tk.NORMAL)
+        self.cancel_button.configure(state=tk.DISABLED)
+        if message[0] == "done":
+            # the results are applied in the main loop, once the search completed
+            chosen_combi, results = self.solver.play_move(*message[1])
+            self.results_visual.show_results()
+            self.history_visual.add_history(chosen_combi, results)
+            self.progress_bar.configure(maximum=1, value=1)
+            self.status_label.configure(text="Solved" if self.solver.is_finished() else "")
+        elif message[0] == "cancelled":
+            self.progress_bar.configure(value=0)
+            self.status_label.configure(text="Search cancelled")
+        else:
+            self.status_label.configure(text=f"Search failed: {message[1]}")
+        self.update_undo_button()
 
 class MainWindow(tk.Frame):
     """ Main visual window """
     game: Game
     solver: Solver
 
-    def __init__(self, parent, game: Game):
+    def __init__(self, parent, game: Game, history_path: Optional[str] = None):
         super().__init__(parent, bg="white", borderwidth=1, relief=tk.SOLID, padx=10, pady=10)
         self.game = game
-        self.solver = Solver(game)
+        self.history_path = history_path
+        self.solver = Solver(game, history=GameHistory(game))
         self.solver.cleanup_combinaisons()
 
         self.add_elements()
@@ -156,7 +357,7 @@ class MainWindow(tk.Frame):
         history_visual = HistoryVisual(self)
         history_visual.grid(row=1, column=1, padx=10, pady=10, sticky="nsew")
 
-        solver_visual = SolverVisual(self, self.solver, results_visual, history_visual)
+        solver_visual = SolverVisual(self, self.solver, results_visual, history_visual, self.history_path)
         solver_visual.grid(row=1, column=0, padx=10, pady=10, sticky="nsew")
 
 
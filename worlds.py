@@ -0,0 +1,128 @@
+""" Hypothesis worlds for games whose verificators have unknown criteria """
+
+import copy
+import itertools
+from typing import Optional, Sequence
+
+from candidates import popcount
+from search import Progress, distinct_tries
+from strategies import Strategy, MinMax
+from verificators import Verificator, MultiCriterion
+
+Assignment = tuple[int, ...]
+
+
+class WorldSet:
+    """ Define the possible (criteria assignment, combinaison) worlds of a game
+
+    An assignment gives the position of the active criterion of every slot
+    (0 for a fixed verificator), and maps to the bitset of the combinaisons
+    still possible with it. Assignments are enumerated once; each result
+    then only updates the live ones, which are dropped as soon as they hold
+    no combinaison, so the product of the criteria is never built again.
+    The worlds dict is replaced by every update, never modified, so that a
+    saved one stays valid.
+    """
+    def __init__(self, verifs: Sequence[Verificator], candidates: int) -> None:
+        self.criteria = [verif.criteria if isinstance(verif, MultiCriterion) else [verif] for verif in verifs]
+        self.tables = [[criterion.get_table() for criterion in criteria] for criteria in self.criteria]
+        self.masks = [[criterion.get_masks() for criterion in criteria] for criteria in self.criteria]
+        self.candidates = candidates
+        self.worlds: dict[Assignment, int] = {
+            assignment: candidates for assignment in itertools.product(*[range(len(criteria)) for criteria in self.criteria])
+        }
+
+    def copy(self) -> "WorldSet":
+        """ Return a copy of the worlds, sharing the compiled tables """
+        worlds = copy.copy(self)
+        worlds.worlds = dict(self.worlds)
+        return worlds
+
+    def get_candidates(self) -> int:
+        """ Return the bitset of the combinaisons possible in any world """
+        candidates = 0
+        for bits in self.worlds.values():
+            candidates |= bits
+        return candidates
+
+    def get_criteria(self, slot: int) -> list[Verificator]:
+        """ Return the criteria of slot that can still be the active one """
+        positions = {assignment[slot] for assignment in self.worlds}
+        return [criterion for position, criterion in enumerate(self.criteria[slot]) if position in positions]
+
+    def discard(self, slot: int, try_index: int, result: bool) -> None:
+        """ Discard the worlds that don't match the result of slot for try_index """
+        masks = [criterion_masks[table[try_index]][result] for table, criterion_masks in zip(self.tables[slot], self.masks[slot])]
+        worlds: dict[Assignment, int] = {}
+        for assignment, bits in self.worlds.items():
+            bits &= masks[assignment[slot]]
+            if bits:
+                worlds[assignment] = bits
+        self.worlds = worlds
+
+    def cleanup(self) -> None:
+        """ Only keep, in every world, the combinaisons identified by their results
+
+        Partitions are refined slot by slot and shared between the assignments
+        with the same prefix. The NO_RESULT masks, stored last, are skipped.
+        """
+        partitions: dict[Assignment, list[int]] = {(): [self.candidates]}
+        worlds: dict[Assignment, int] = {}
+        for assignment, world in self.worlds.items():
+            for length in range(1, len(assignment) + 1):
+                prefix = assignment[:length]
+                if prefix not in partitions:
+                    masks = self.masks[length - 1][prefix[-1]]
+                    partitions[prefix] = [block & true_mask for block in partitions[prefix[:-1]] for _, true_mask in masks[:-1] if block & true_mask]
+            bits = 0
+            for block in partitions[assignment]:
+                if popcount(block) == 1:
+                    bits |= block
+            bits &= world
+            if bits:
+                worlds[assignment] = bits
+        self.worlds = worlds
+
+    def get_sizes(self, groups: dict[Assignment, int], try_index: int, subset: tuple[int, ...]) -> list[int]:
+        """ Return the number of combinaisons possible after each answer of subset for try_index
+
+        groups maps the criteria of the subset to the combinaisons possible with them.
+        """
+        blocks: dict[tuple[bool, ...], int] = {}
+        for key, bits in groups.items():
+            parts: list[tuple[tuple[bool, ...], int]] = [((), bits)]
+            for slot, position in zip(subset, key):
+                false_mask, true_mask = self.masks[slot][position][self.tables[slot][position][try_index]]
+                parts = [(answers + (is_true,), part & mask) for answers, part in parts
+                         for is_true, mask in ((False, false_mask), (True, true_mask)) if part & mask]
+            for answers, part in parts:
+                blocks[answers] = blocks.get(answers, 0) | part
+        return [popcount(block) for block in blocks.values()]
+
+    def search(self, tries: Sequence[int], subsets: Sequence[tuple[int, ...]], strategy: Strategy = MinMax(),
+               progress: Optional[Progress] = None) -> tuple[int, int]:
+        """ Returns the (try, subset) with the lowest score for strategy
+
+        Same as python_search, an answer leading to the combinaisons of every
+        world it is consistent with.
+        """
+        best_score: Optional[float] = None
+        solution = None
+        tries = distinct_tries([table for tables in self.tables for table in tables], tries)
+        for subset_index, subset in enumerate(subsets):
+            groups: dict[Assignment, int] = {}
+            for assignment, bits in self.worlds.items():
+                key = tuple(assignment[slot] for slot in subset)
+                groups[key] = groups.get(key, 0) | bits
+            for try_index in tries:
+                score = strategy.score(self.get_sizes(groups, try_index, subset))
+                if best_score is None or score < best_score:
+                    best_score = score
+                    solution = (try_index, subset_index)
+            if progress is not None:
+                progress(subset_index + 1, len(subsets))
+        assert solution is not None
+        return solution
+
+    def __len__(self) -> int:
+        return len(self.worlds)